@@ -0,0 +1,102 @@
+# Banco de pruebas de los algoritmos de círculo de main.py
+# Compara Punto Medio y Paramétrico (y sus versiones originales con bucle)
+# sin abrir ninguna ventana y guarda los resultados en JSON o CSV
+#
+# Uso: python benchmark_circulos.py --radios 10 100 1000 --formato csv --salida resultados.csv
+
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import csv
+import json
+import math
+import sys
+import time
+import numpy as np
+from main import puntos_punto_medio, puntos_parametrico
+
+# Versiones originales con bucle en Python, como referencia
+def punto_medio_bucle(radius):
+    puntos = []
+    x, y = 0, radius
+    d = 1 - radius
+    while x <= y:
+        for dx, dy in [( x, y),( y, x),(-x, y),(-y, x),( x,-y),( y,-x),(-x,-y),(-y,-x)]:
+            puntos.append((dx, dy))
+        if d < 0:
+            d += 2*x + 1
+        else:
+            d += 2*(x - y) + 1
+            y -= 1
+        x += 1
+    return np.array(puntos, dtype=np.float64)
+
+def parametrico_bucle(radius):
+    puntos = []
+    for deg in range(360):
+        theta = math.radians(deg)
+        puntos.append((radius*math.cos(theta), radius*math.sin(theta)))
+    return np.array(puntos, dtype=np.float64)
+
+ALGORITMOS = {
+    "punto_medio": puntos_punto_medio,
+    "parametrico": puntos_parametrico,
+    "punto_medio_bucle": punto_medio_bucle,
+    "parametrico_bucle": parametrico_bucle,
+}
+
+CAMPOS = ["algoritmo", "radio", "puntos", "tiempo_s", "puntos_por_segundo",
+          "tasa_duplicados", "error_radial_max"]
+
+def medir(algoritmo, radius, repeticiones):
+    """Ejecuta el algoritmo varias veces y devuelve las métricas del mejor tiempo."""
+    generador = ALGORITMOS[algoritmo]
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        puntos = generador(radius)
+        tiempos.append(time.perf_counter() - inicio)
+    tiempo = min(tiempos)
+
+    # Las métricas de calidad se miden sobre los píxeles que se encienden
+    pixeles = np.rint(np.asarray(puntos, dtype=np.float64)).astype(np.int64)
+    unicos = len(np.unique(pixeles, axis=0))
+    error = np.abs(np.hypot(pixeles[:, 0], pixeles[:, 1]) - radius).max()
+    return {
+        "algoritmo": algoritmo,
+        "radio": radius,
+        "puntos": len(pixeles),
+        "tiempo_s": tiempo,
+        "puntos_por_segundo": len(pixeles) / tiempo if tiempo > 0 else float("inf"),
+        "tasa_duplicados": 1 - unicos / len(pixeles),
+        "error_radial_max": float(error),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara los algoritmos de círculo de main.py")
+    parser.add_argument("--radios", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--algoritmos", nargs="+", choices=list(ALGORITMOS), default=list(ALGORITMOS))
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--formato", choices=["json", "csv"], default="json")
+    parser.add_argument("--salida", help="archivo de salida (por defecto la salida estándar)")
+    args = parser.parse_args()
+
+    resultados = [medir(algoritmo, radio, args.repeticiones)
+                  for algoritmo in args.algoritmos for radio in args.radios]
+
+    salida = open(args.salida, "w", newline="") if args.salida else sys.stdout
+    try:
+        if args.formato == "json":
+            json.dump(resultados, salida, indent=2)
+            salida.write("\n")
+        else:
+            escritor = csv.DictWriter(salida, fieldnames=CAMPOS)
+            escritor.writeheader()
+            escritor.writerows(resultados)
+    finally:
+        if salida is not sys.stdout:
+            salida.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# Banco de pruebas de las transformaciones de paint.py
+# Compara aplicar la matriz punto por punto (como hacía aplicar_transformacion)
+# con transformar_puntos sobre todo el arreglo, con y sin un arreglo de salida
+# ya reservado, y con una pila de matrices (una por figura)
+#
+# Uso: python benchmark_transformaciones.py --puntos 10 1000 1000000 --formato csv --salida resultados.csv
+
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import csv
+import json
+import sys
+import time
+import numpy as np
+from paint import transformar_puntos, crear_matriz_traslacion, crear_matriz_rotacion, crear_matriz_escala
+
+# Versión original: un vector homogéneo y un producto por cada punto
+def por_punto(puntos, matrices, salida):
+    resultado = []
+    for grupo, matriz in zip(puntos, matrices):
+        for x, y in grupo:
+            transformado = matriz.dot(np.array([x, y, 1]))
+            resultado.append((transformado[0], transformado[1]))
+    return np.array(resultado, dtype=np.float64).reshape(puntos.shape)
+
+def lote(puntos, matrices, salida):
+    return np.stack([transformar_puntos(grupo, matriz) for grupo, matriz in zip(puntos, matrices)])
+
+def lote_en_lugar(puntos, matrices, salida):
+    for grupo, matriz, destino in zip(puntos, matrices, salida):
+        transformar_puntos(grupo, matriz, salida=destino)
+    return salida
+
+def pila(puntos, matrices, salida):
+    return transformar_puntos(puntos, matrices, salida=salida)
+
+ALGORITMOS = {
+    "por_punto": por_punto,
+    "lote": lote,
+    "lote_en_lugar": lote_en_lugar,
+    "pila": pila,
+}
+
+CAMPOS = ["algoritmo", "puntos", "figuras", "tiempo_s", "puntos_por_segundo",
+          "aceleracion", "error_max"]
+
+def matrices_de_prueba(figuras, generador):
+    """Una rotación y escala distinta por figura alrededor de un centro al azar."""
+    matrices = []
+    for _ in range(figuras):
+        cx, cy = generador.uniform(0, 1000, 2)
+        M = crear_matriz_traslacion(cx, cy).dot(crear_matriz_rotacion(generador.uniform(0, 360)))
+        M = M.dot(crear_matriz_escala(*generador.uniform(0.5, 2, 2))).dot(crear_matriz_traslacion(-cx, -cy))
+        matrices.append(M)
+    return np.array(matrices)
+
+def medir(algoritmo, cantidad, figuras, repeticiones):
+    """Ejecuta el algoritmo varias veces y devuelve las métricas del mejor tiempo."""
+    figuras = max(1, min(figuras, cantidad))
+    generador = np.random.default_rng(0)
+    puntos = generador.uniform(0, 1000, (figuras, cantidad // figuras, 2))
+    matrices = matrices_de_prueba(figuras, generador)
+    salida = np.empty_like(puntos)
+
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = ALGORITMOS[algoritmo](puntos, matrices, salida)
+        tiempos.append(time.perf_counter() - inicio)
+    tiempo = min(tiempos)
+
+    # Referencia: coordenadas homogéneas completas de cada grupo
+    homogeneos = np.concatenate([puntos, np.ones(puntos.shape[:-1] + (1,))], axis=-1)
+    referencia = np.matmul(homogeneos, np.swapaxes(matrices, -1, -2))[..., :2]
+    return {
+        "algoritmo": algoritmo,
+        "puntos": puntos.shape[0] * puntos.shape[1],
+        "figuras": figuras,
+        "tiempo_s": tiempo,
+        "puntos_por_segundo": puntos.shape[0] * puntos.shape[1] / tiempo if tiempo > 0 else float("inf"),
+        "aceleracion": None,
+        "error_max": float(np.abs(resultado - referencia).max()),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara las transformaciones de puntos de paint.py")
+    parser.add_argument("--puntos", type=int, nargs="+", default=[10, 1000, 1000000])
+    parser.add_argument("--figuras", type=int, default=10, help="matrices distintas entre las que se reparten los puntos")
+    parser.add_argument("--algoritmos", nargs="+", choices=list(ALGORITMOS), default=list(ALGORITMOS))
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--formato", choices=["json", "csv"], default="json")
+    parser.add_argument("--salida", help="archivo de salida (por defecto la salida estándar)")
+    args = parser.parse_args()
+
+    resultados = [medir(algoritmo, cantidad, args.figuras, args.repeticiones)
+                  for algoritmo in args.algoritmos for cantidad in args.puntos]
+
+    # La aceleración se mide contra la versión punto por punto con los mismos puntos
+    base = {r["puntos"]: r["tiempo_s"] for r in resultados if r["algoritmo"] == "por_punto"}
+    for resultado in resultados:
+        if resultado["puntos"] in base and resultado["tiempo_s"] > 0:
+            resultado["aceleracion"] = base[resultado["puntos"]] / resultado["tiempo_s"]
+
+    salida = open(args.salida, "w", newline="") if args.salida else sys.stdout
+    try:
+        if args.formato == "json":
+            json.dump(resultados, salida, indent=2)
+            salida.write("\n")
+        else:
+            escritor = csv.DictWriter(salida, fieldnames=CAMPOS)
+            escritor.writeheader()
+            escritor.writerows(resultados)
+    finally:
+        if salida is not sys.stdout:
+            salida.close()
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import pygame
 from pygame.locals import *
 from OpenGL.GL import *
 from OpenGL.GLU import *
+import numpy as np
 
 # Configuración inicial
 ANCHO = 800
@@ -11,8 +12,25 @@ grosor = 2.0
 lineas = []
 punto_inicial = None
 
+# Redibujado por eventos: la escena solo se vuelve a dibujar cuando un clic,
+# un cambio de color o de grosor o un borrado la marcan como sucia
+REDIBUJO_POR_EVENTOS = True
+FPS_MAXIMO = 60  # None para no limitar los cuadros por segundo
+cuadros_omitidos = 0
+
+# Lista de visualización de la cuadrícula y la clave (ANCHO, ALTO, paso) con la que se compiló
+lista_plano = None
+clave_plano = None
+
+# Caché de rasterización: cada línea se rasteriza una sola vez y sus píxeles
+# se añaden a un búfer de vértices que crece según se necesite
+cache_lineas = {}  # (punto_inicial, punto_final) -> (inicio, fin) en el búfer
+vertices = np.empty((1024, 2), dtype=np.int32)
+total_vertices = 0
+lineas_rasterizadas = 0
+
 def bresenham(x1, y1, x2, y2):
-    """Dibuja una línea con el algoritmo de Bresenham."""
+    """Calcula los píxeles de una línea con el algoritmo de Bresenham."""
     x1 = int(round(x1))
     y1 = int(round(y1))
     x2 = int(round(x2))
@@ -24,8 +42,9 @@ def bresenham(x1, y1, x2, y2):
     sy = 1 if y2 >= y1 else -1
     err = dx - dy
 
+    puntos = []
     while True:
-        glVertex2i(x1, y1)
+        puntos.append((x1, y1))
         if x1 == x2 and y1 == y2:
             break
         e2 = 2 * err
@@ -35,33 +54,198 @@ def bresenham(x1, y1, x2, y2):
         if e2 < dx:
             err += dx
             y1 += sy
+    return puntos
+
+def rasterizar_lineas(lineas):
+    """Rasteriza todas las líneas a la vez y devuelve un arreglo int32 (N, 2).
+
+    Produce los mismos píxeles que `bresenham`, pero sin bucle por píxel: en
+    el paso i del eje mayor, el desplazamiento en el eje menor es
+    (2*i*menor + mayor - 1) // (2*mayor), que es la forma cerrada del error
+    acumulado de Bresenham.
+    """
+    if len(lineas) == 0:
+        return np.empty((0, 2), dtype=np.int32)
+
+    extremos = np.rint(np.asarray(lineas, dtype=np.float64).reshape(-1, 4)).astype(np.int64)
+    x1, y1, x2, y2 = extremos.T
+    dx = np.abs(x2 - x1)
+    dy = np.abs(y2 - y1)
+    mayor = np.maximum(dx, dy)
+    menor = np.minimum(dx, dy)
+    # int32 basta mientras 2*i*menor no desborde; es la mitad de memoria que int64
+    tipo = np.int32 if 2 * int(mayor.max()) ** 2 < 2 ** 31 else np.int64
+
+    # Paso i de cada píxel generado dentro de su línea
+    cantidades = mayor + 1
+    inicios = np.cumsum(cantidades) - cantidades
+    i = np.arange(int(cantidades.sum()), dtype=tipo)
+    i -= np.repeat(inicios.astype(tipo), cantidades)
+
+    paso_menor = np.repeat((2 * menor).astype(tipo), cantidades)
+    paso_menor *= i
+    paso_menor += np.repeat(np.maximum(mayor - 1, 0).astype(tipo), cantidades)
+    paso_menor //= np.repeat(np.maximum(2 * mayor, 1).astype(tipo), cantidades)
+
+    eje_x = np.repeat(dx >= dy, cantidades)
+    signos = np.stack([np.where(x2 >= x1, 1, -1), np.where(y2 >= y1, 1, -1)], axis=1)
+
+    vertices = np.empty((len(i), 2), dtype=np.int32)
+    vertices[:, 0] = np.where(eje_x, i, paso_menor)
+    vertices[:, 1] = np.where(eje_x, paso_menor, i)
+    vertices *= np.repeat(signos.astype(np.int32), cantidades, axis=0)
+    vertices += np.repeat(extremos[:, :2].astype(np.int32), cantidades, axis=0)
+    return vertices
+
+def dibujar_vertices(vertices):
+    """Envía un arreglo de vértices (N, 2) int32 con una sola llamada a glDrawArrays."""
+    if len(vertices) == 0:
+        return
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glVertexPointer(2, GL_INT, 0, vertices)
+    glDrawArrays(GL_POINTS, 0, len(vertices))
+    glDisableClientState(GL_VERTEX_ARRAY)
+
+def crear_plano(paso=100):
+    """Dibuja una cuadrícula cada `paso` píxeles desde una lista de visualización."""
+    global lista_plano, clave_plano
+    clave = (ANCHO, ALTO, paso)
+    if lista_plano is None or clave != clave_plano:
+        # La cuadrícula solo se compila de nuevo si cambia la ventana o el paso
+        if lista_plano is None:
+            lista_plano = glGenLists(1)
+        glNewList(lista_plano, GL_COMPILE)
+        glColor3f(0.8, 0.8, 0.8)
+        glBegin(GL_LINES)
+        for i in range(0, ANCHO, paso):
+            glVertex2i(i, 0)
+            glVertex2i(i, ALTO)
+        for j in range(0, ALTO, paso):
+            glVertex2i(0, j)
+            glVertex2i(ANCHO, j)
+        glEnd()
+        glEndList()
+        clave_plano = clave
+    glCallList(lista_plano)
+
+def rasterizar_framebuffer(lineas, color=None, grosor_puntos=None, fondo=(0, 0, 0),
+                           descartar_fuera=True):
+    """Dibuja las líneas en un framebuffer NumPy uint8 (ALTO, ANCHO, 3) sin OpenGL.
+
+    Aplica la misma regla que GL_POINTS sin suavizado: un vértice entero (x, y)
+    de tamaño n cubre los píxeles x - n//2 .. x - n//2 + n - 1 en cada eje.
+    La fila 0 del resultado es la parte superior de la ventana.
 
-def crear_plano():
-    """Dibuja una cuadrícula cada 100 píxeles."""
-    glColor3f(0.8, 0.8, 0.8)
-    glBegin(GL_LINES)
-    for i in range(0, ANCHO, 100):
-        glVertex2i(i, 0)
-        glVertex2i(i, ALTO)
-    for j in range(0, ALTO, 100):
-        glVertex2i(0, j)
-        glVertex2i(ANCHO, j)
-    glEnd()
+    Los puntos cuyo vértice cae fuera de la ventana dependen del controlador:
+    la especificación de OpenGL los descarta enteros (descartar_fuera=True),
+    pero algunos controladores dibujan la parte de su cuadrado que queda dentro
+    (descartar_fuera=False). Con grosor mayor que 1, las líneas que cruzan el
+    borde pueden diferir de glDrawArrays en un controlador del otro tipo; las
+    que quedan dentro de la ventana coinciden siempre.
+
+    Pendiente: con 10k líneas que cruzan toda la ventana (unos 3.3M píxeles)
+    tarda cerca de 160 ms, más que los 50 ms buscados; la mitad se va en
+    rasterizar_lineas. Con 10k líneas cortas (hasta 30 px) tarda entre
+    20 y 50 ms según la máquina.
+    """
+    if color is None:
+        color = color_actual
+    if grosor_puntos is None:
+        grosor_puntos = grosor
+    n = max(1, int(round(grosor_puntos)))
+
+    # Cada punto que se dibuja marca la esquina de su cuadrado n x n en una
+    # máscara con n filas y columnas de más; lo que cae fuera de la ventana
+    # se recorta al extender las esquinas
+    vertices = rasterizar_lineas(lineas)
+    x = vertices[:, 0]
+    y = vertices[:, 1]
+    desplazamiento = n - 1 - n // 2
+    if descartar_fuera:
+        dentro = (x >= 0) & (x <= ANCHO) & (y >= 0) & (y <= ALTO)
+    else:
+        dentro = ((x + desplazamiento >= 0) & (x + desplazamiento < ANCHO + n) &
+                  (y + desplazamiento >= 0) & (y + desplazamiento < ALTO + n))
+    ancho_mascara = ANCHO + n
+    descarte = (ALTO + n) * ancho_mascara  # posición extra para los puntos recortados
+    indices = np.where(dentro, (y + desplazamiento) * ancho_mascara + (x + desplazamiento), descarte)
+    plano = np.zeros(descarte + 1, dtype=bool)
+    plano[indices] = True
+    mascara = plano[:-1].reshape(ALTO + n, ancho_mascara)
+
+    # Extiende cada esquina a un cuadrado n x n, separando filas y columnas
+    columnas = np.zeros((ALTO + n, ANCHO), dtype=bool)
+    for k in range(n):
+        columnas |= mascara[:, k:k + ANCHO]
+    cubierto = np.zeros((ALTO, ANCHO), dtype=bool)
+    for k in range(n):
+        cubierto |= columnas[k:k + ALTO]
+
+    framebuffer = np.empty((ALTO, ANCHO, 3), dtype=np.uint8)
+    framebuffer[:] = np.round(np.asarray(fondo, dtype=np.float64) * 255)
+    framebuffer[cubierto] = np.round(np.asarray(color, dtype=np.float64) * 255)
+    return framebuffer[::-1]
+
+def guardar_png(framebuffer, ruta):
+    """Guarda un framebuffer (ALTO, ANCHO, 3) como imagen PNG."""
+    superficie = pygame.surfarray.make_surface(np.ascontiguousarray(framebuffer.swapaxes(0, 1)))
+    pygame.image.save(superficie, ruta)
+
+def reiniciar_cache():
+    """Vacía la caché de rasterización y el búfer de vértices."""
+    global total_vertices, lineas_rasterizadas
+    cache_lineas.clear()
+    total_vertices = 0
+    lineas_rasterizadas = 0
+
+def actualizar_cache():
+    """Rasteriza solo las líneas añadidas desde la última llamada."""
+    global vertices, total_vertices, lineas_rasterizadas
+    nuevas = lineas[lineas_rasterizadas:]
+    if not nuevas:
+        return
+
+    # Las líneas repetidas reutilizan los píxeles ya rasterizados
+    pendientes = list(dict.fromkeys(l for l in nuevas if l not in cache_lineas))
+    bloques = {}
+    if pendientes:
+        pixeles = rasterizar_lineas(pendientes)
+        extremos = np.rint(np.asarray(pendientes, dtype=np.float64))
+        cantidades = np.abs(extremos[:, 1] - extremos[:, 0]).max(axis=1).astype(np.int64) + 1
+        for linea, bloque in zip(pendientes, np.split(pixeles, np.cumsum(cantidades)[:-1])):
+            bloques[linea] = bloque
+
+    requeridos = total_vertices + sum(
+        len(bloques[l]) if l in bloques else cache_lineas[l][1] - cache_lineas[l][0] for l in nuevas)
+    if requeridos > len(vertices):
+        ampliado = np.empty((max(requeridos, 2 * len(vertices)), 2), dtype=np.int32)
+        ampliado[:total_vertices] = vertices[:total_vertices]
+        vertices = ampliado
+
+    for linea in nuevas:
+        if linea in bloques:
+            bloque = bloques.pop(linea)
+        else:
+            inicio, fin = cache_lineas[linea]
+            bloque = vertices[inicio:fin]
+        fin = total_vertices + len(bloque)
+        vertices[total_vertices:fin] = bloque
+        cache_lineas.setdefault(linea, (total_vertices, fin))
+        total_vertices = fin
+    lineas_rasterizadas = len(lineas)
 
 def dibujar():
     """Dibuja todas las líneas y el plano."""
+    actualizar_cache()
     glClear(GL_COLOR_BUFFER_BIT)
     crear_plano()
     glColor3f(*color_actual)
     glPointSize(grosor)
-    glBegin(GL_POINTS)
-    for linea in lineas:
-        bresenham(linea[0][0], linea[0][1], linea[1][0], linea[1][1])
-    glEnd()
+    dibujar_vertices(vertices[:total_vertices])
     pygame.display.flip()
 
 def main():
-    global punto_inicial, color_actual, grosor
+    global punto_inicial, color_actual, grosor, cuadros_omitidos
 
     pygame.init()
     pygame.display.set_mode((ANCHO, ALTO), DOUBLEBUF | OPENGL)
@@ -70,12 +254,22 @@ def main():
 
     reloj = pygame.time.Clock()
     corriendo = True
+    escena_sucia = True
 
     while corriendo:
-        for evento in pygame.event.get():
+        if REDIBUJO_POR_EVENTOS and not escena_sucia and not FPS_MAXIMO:
+            # Sin límite de FPS se bloquea hasta el siguiente evento
+            eventos = [pygame.event.wait()] + pygame.event.get()
+        else:
+            eventos = pygame.event.get()
+
+        for evento in eventos:
             if evento.type == QUIT:
                 corriendo = False
 
+            elif evento.type == VIDEOEXPOSE:
+                escena_sucia = True
+
             elif evento.type == MOUSEBUTTONDOWN and evento.button == 1:
                 x, y = evento.pos
                 y = ALTO - y  # Invertir eje Y
@@ -85,6 +279,7 @@ def main():
                     punto_final = (x, y)
                     lineas.append((punto_inicial, punto_final))
                     punto_inicial = None
+                escena_sucia = True
 
             elif evento.type == KEYDOWN:
                 if evento.key == K_r:
@@ -95,14 +290,26 @@ def main():
                     color_actual = (0.0, 0.0, 1.0)
                 elif evento.key == K_c:
                     lineas.clear()
+                    reiniciar_cache()
                 elif evento.key == K_PLUS or evento.key == K_KP_PLUS:
                     grosor += 1.0
                 elif evento.key == K_MINUS or evento.key == K_KP_MINUS:
                     grosor = max(1.0, grosor - 1.0)
+                else:
+                    continue
+                escena_sucia = True
+
+        if escena_sucia or not REDIBUJO_POR_EVENTOS:
+            dibujar()
+            escena_sucia = False
+        else:
+            cuadros_omitidos += 1
 
-        dibujar()
-        reloj.tick(60)
+        if FPS_MAXIMO:
+            reloj.tick(FPS_MAXIMO)
 
+    print(f"Cuadros omitidos: {cuadros_omitidos}")
     pygame.quit()
 
-main()
+if __name__ == "__main__":
+    main()
@@ -4,73 +4,226 @@ from pygame.locals import *
 from OpenGL.GL import *
 from OpenGL.GLU import *
 import math
+import numpy as np
+from collections import OrderedDict
 
 # =========================
 # Helper: dibujar texto con OpenGL
+# Cada texto se rasteriza y se sube a una textura una sola vez; las texturas
+# se guardan en una caché LRU para que los textos que cambian (como el radio
+# que se está escribiendo) no la llenen
 # =========================
-def texto(text, x, y, font, color=(0,0,0,0)):
-    """
-    Renderiza 'text' con pygame.font a una superficie,
-    luego la dibuja en la posición de ventana (x,y) usando glDrawPixels.
-    """
+CACHE_TEXTOS_MAX = 64
+cache_textos = OrderedDict()
+
+def textura_texto(text, font, color):
+    clave = (text, font, tuple(color[:3]))
+    entrada = cache_textos.get(clave)
+    if entrada is not None:
+        cache_textos.move_to_end(clave)
+        return entrada
+
     superficie = font.render(text, True, color[:3])
     data = pygame.image.tostring(superficie, "RGBA", True)
     w, h = superficie.get_size()
+    textura = glGenTextures(1)
+    glBindTexture(GL_TEXTURE_2D, textura)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+    glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, w, h, 0, GL_RGBA, GL_UNSIGNED_BYTE, data)
+
+    entrada = (textura, w, h)
+    cache_textos[clave] = entrada
+    while len(cache_textos) > CACHE_TEXTOS_MAX:
+        _, (vieja, _, _) = cache_textos.popitem(last=False)  # Descarta la menos usada
+        glDeleteTextures([vieja])
+    return entrada
+
+def texto(text, x, y, font, color=(0,0,0,0)):
+    """
+    Dibuja 'text' en la posición de ventana (x,y) como un quad con la textura
+    cacheada del texto renderizado con pygame.font.
+    """
+    textura, w, h = textura_texto(text, font, color)
+    glEnable(GL_TEXTURE_2D)
+    glBindTexture(GL_TEXTURE_2D, textura)
+    glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_REPLACE)
     glEnable(GL_BLEND)
     glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-    glWindowPos2f(x, y)
-    glDrawPixels(w, h, GL_RGBA, GL_UNSIGNED_BYTE, data)
+    glBegin(GL_QUADS)
+    glTexCoord2f(0, 0); glVertex2f(x, y)
+    glTexCoord2f(1, 0); glVertex2f(x + w, y)
+    glTexCoord2f(1, 1); glVertex2f(x + w, y + h)
+    glTexCoord2f(0, 1); glVertex2f(x, y + h)
+    glEnd()
     glDisable(GL_BLEND)
+    glDisable(GL_TEXTURE_2D)
 
 # =========================
-# Dibuja la cuadrícula
+# Dibuja la cuadrícula desde una lista de visualización
 # =========================
+lista_cuadricula = None
+clave_cuadricula = None
+
 def cuadricula(width, height, step=20):
-    glColor3f(0.8, 0.8, 0.8)
-    glLineWidth(1)
-    glBegin(GL_LINES)
-    # Líneas verticales
-    for x in range(0, width, step):
-        glVertex2f(x, 0)
-        glVertex2f(x, height)
-    # Líneas horizontales
-    for y in range(0, height, step):
-        glVertex2f(0, y)
-        glVertex2f(width, y)
-    glEnd()
+    global lista_cuadricula, clave_cuadricula
+    clave = (width, height, step)
+    if lista_cuadricula is None or clave != clave_cuadricula:
+        # Se compila una sola vez; solo se rehace si cambia el tamaño o el paso
+        if lista_cuadricula is None:
+            lista_cuadricula = glGenLists(1)
+        glNewList(lista_cuadricula, GL_COMPILE)
+        glColor3f(0.8, 0.8, 0.8)
+        glLineWidth(1)
+        glBegin(GL_LINES)
+        # Líneas verticales
+        for x in range(0, width, step):
+            glVertex2f(x, 0)
+            glVertex2f(x, height)
+        # Líneas horizontales
+        for y in range(0, height, step):
+            glVertex2f(0, y)
+            glVertex2f(width, y)
+        glEnd()
+        glEndList()
+        clave_cuadricula = clave
+    glCallList(lista_cuadricula)
 
 # =========================
 # Algoritmo de Punto Medio
 # =========================
-def punto_medio(cx, cy, radius, color, thickness):
-    x, y = 0, radius
-    d = 1 - radius
+def octante_punto_medio(radius):
+    """
+    Calcula de una vez los puntos (x, y) del primer octante que recorre el
+    bucle de decisión del punto medio. Como d se actualiza con el x anterior,
+    el y de cada columna x > 0 es el menor entero que cumple
+    (2y + 3)^2 >= 4r^2 + 8r - 3 - 4(x - 1)^2.
+    """
+    x = np.arange(int(radius / math.sqrt(2)) + 2, dtype=np.int64)
+    t = 4 * radius * radius + 8 * radius - 3 - 4 * (x - 1) ** 2
+    # Raíz entera exacta de t, corrigiendo el redondeo de sqrt en flotante
+    raiz = np.floor(np.sqrt(np.maximum(t, 0))).astype(np.int64)
+    raiz -= raiz * raiz > t
+    raiz += (raiz + 1) * (raiz + 1) <= t
+    raiz += raiz * raiz < t
+    impar = raiz + (raiz % 2 == 0)
+    y = (impar - 3) // 2
+    y[0] = radius
+    dentro = x <= y
+    return x[dentro], y[dentro]
+
+def puntos_punto_medio(radius):
+    """
+    Refleja el primer octante en los 8 octantes con signos y permutaciones
+    y devuelve los desplazamientos como arreglo int32 (N, 2) sin repetidos.
+    """
+    if radius <= 0:
+        return np.zeros((1, 2), dtype=np.int32)
+    x, y = octante_punto_medio(radius)
+    signos = np.array([(1, 1), (-1, 1), (1, -1), (-1, -1)], dtype=np.int64)
+
+    # Los puntos con 0 < x < y dan 8 puntos distintos; los de los ejes
+    # (x = 0) y la diagonal (x = y) solo 4, así no hace falta deduplicar
+    general = (x > 0) & (x < y)
+    a, b = x[general], y[general]
+    octantes = np.concatenate([np.stack([a, b], axis=1), np.stack([b, a], axis=1)])
+    diagonal = x[(x > 0) & (x == y)]
+    diagonales = np.stack([diagonal, diagonal], axis=1)
+    ejes = np.array([(0, radius), (radius, 0)], dtype=np.int64)
+
+    puntos = np.concatenate([
+        (octantes[None, :, :] * signos[:, None, :]).reshape(-1, 2),
+        (diagonales[None, :, :] * signos[:, None, :]).reshape(-1, 2),
+        np.concatenate([ejes, -ejes]),
+    ])
+    return puntos.astype(np.int32)
+
+def dibujar_puntos(puntos, cx, cy, color, thickness):
+    """
+    Dibuja un arreglo (N, 2) de desplazamientos (int32 o float32) alrededor
+    de (cx, cy) con una sola llamada a glDrawArrays.
+    """
     glColor3f(*color)
     glPointSize(thickness)
-    glBegin(GL_POINTS)
-    while x <= y:
-        for dx, dy in [( x, y),( y, x),(-x, y),(-y, x),( x,-y),( y,-x),(-x,-y),(-y,-x)]:
-            glVertex2f(cx+dx, cy+dy)
-        if d < 0:
-            d += 2*x + 1
-        else:
-            d += 2*(x - y) + 1
-            y -= 1
-        x += 1
-    glEnd()
+    glPushMatrix()
+    glTranslatef(cx, cy, 0)
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glVertexPointer(2, GL_INT if puntos.dtype == np.int32 else GL_FLOAT, 0, puntos)
+    glDrawArrays(GL_POINTS, 0, len(puntos))
+    glDisableClientState(GL_VERTEX_ARRAY)
+    glPopMatrix()
+
+def punto_medio(cx, cy, radius, color, thickness):
+    dibujar_puntos(puntos_circulo("punto_medio", radius), cx, cy, color, thickness)
 
 # =========================
 # Algoritmo Paramétrico
 # =========================
+# Tablas de coseno y seno compartidas. Se guarda solo la más grande calculada
+# (con un número de muestras potencia de dos) y las menores son vistas con paso
+tabla_cos = np.ones(1)
+tabla_sen = np.zeros(1)
+
+def muestras_parametrico(radius):
+    """
+    Menor potencia de dos de muestras que deja los puntos vecinos a lo sumo a
+    un píxel: la cuerda 2*r*sin(pi/n) debe ser <= 1.
+    """
+    if radius <= 0.5:
+        return 8
+    n = math.pi / math.asin(1 / (2 * radius))
+    return max(8, 1 << math.ceil(math.log2(n)))
+
+def tablas_trigonometricas(n):
+    global tabla_cos, tabla_sen
+    if len(tabla_cos) < n:
+        theta = np.arange(n) * (2 * math.pi / n)
+        tabla_cos, tabla_sen = np.cos(theta), np.sin(theta)
+    paso = len(tabla_cos) // n
+    return tabla_cos[::paso], tabla_sen[::paso]
+
+def puntos_parametrico(radius):
+    """
+    Devuelve los desplazamientos (radio*cos, radio*sin) como arreglo float32
+    (N, 2), con N elegido según el radio para que el círculo no tenga huecos.
+    """
+    cos, sen = tablas_trigonometricas(muestras_parametrico(radius))
+    return (radius * np.stack([cos, sen], axis=1)).astype(np.float32)
+
 def parametrico(cx, cy, radius, color, thickness):
-    glColor3f(*color)
-    glPointSize(thickness)
-    glBegin(GL_POINTS)
-    for deg in range(360):
-        theta = math.radians(deg)
-        glVertex2f(cx + radius*math.cos(theta),
-                   cy + radius*math.sin(theta))
-    glEnd()
+    dibujar_puntos(puntos_circulo("parametrico", radius), cx, cy, color, thickness)
+
+# =========================
+# Caché LRU de puntos de círculo
+# Los puntos se guardan centrados en el origen por (algoritmo, radio) y se
+# trasladan a (cx, cy) al dibujar, así volver a un radio ya usado no cuesta nada
+# =========================
+CACHE_CIRCULOS_MAX = 32
+cache_circulos = OrderedDict()
+cache_aciertos = 0
+cache_fallos = 0
+
+GENERADORES_CIRCULO = {
+    "punto_medio": puntos_punto_medio,
+    "parametrico": puntos_parametrico,
+}
+
+def puntos_circulo(algoritmo, radius):
+    global cache_aciertos, cache_fallos
+    clave = (algoritmo, radius)
+    puntos = cache_circulos.get(clave)
+    if puntos is not None:
+        cache_circulos.move_to_end(clave)
+        cache_aciertos += 1
+        return puntos
+
+    cache_fallos += 1
+    puntos = GENERADORES_CIRCULO[algoritmo](radius)
+    cache_circulos[clave] = puntos
+    while len(cache_circulos) > CACHE_CIRCULOS_MAX:
+        cache_circulos.popitem(last=False)  # Descarta el menos usado
+    return puntos
 
 # =========================
 # Dibuja el menú con opciones
@@ -189,6 +342,8 @@ def main():
         pygame.display.flip()
         clock.tick(30)
 
+    print(f"Caché de círculos: {cache_aciertos} aciertos, {cache_fallos} fallos")
     pygame.quit()
 
-main()
+if __name__ == "__main__":
+    main()
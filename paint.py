@@ -7,6 +7,8 @@ from pygame.locals import *
 from OpenGL.GL import *
 from OpenGL.GLU import *
 import math  # Importar para el dibujo del circulo
+import time  # Importar para medir la latencia de los cuadros
+from itertools import groupby  # Importar para juntar figuras seguidas del mismo estilo
 import numpy as np  # Importar numpy para operaciones con matrices
 from ventana_3D import abrir_ventana_3d  # Importar la ventana 3D para usarla en el paint
 from numpy.linalg import inv
@@ -20,6 +22,75 @@ ABAJO = 4
 ARRIBA = 8
 SELECCIONAR = 'seleccionar'
 
+# Almacén de cada tipo de figura. Las figuras se guardan en diccionarios
+# {id: figura} con ids crecientes: el orden de dibujo es el de inserción y los
+# índices espaciales pueden referirse a una figura aunque se borren otras
+ALMACEN_DE_TIPO = {
+    'trazo': 'trazos_almacenados',
+    'linea': 'lineas_almacenadas',
+    'curva': 'curvas_almacenadas',
+    'circulo': 'circulos_almacenados',
+    'rectangulo': 'rectangulos_almacenados',
+}
+ALMACENES = list(ALMACEN_DE_TIPO.values())
+
+# Lo que tiene cada capa por separado. Las mismas claves de estado apuntan a
+# las de la capa activa, así las herramientas trabajan siempre sobre ella
+CLAVES_CAPA = ALMACENES + ['transformaciones', 'rejilla', 'arbol_seleccion', 'arbol_dibujo', 'cache_recorte', 'lienzo']
+
+# Opacidades por las que pasa la tecla O
+OPACIDADES_CAPA = [1.0, 0.75, 0.5, 0.25]
+
+# Lado en pixeles de las celdas de la rejilla que usa el borrador
+TAMANHO_CELDA = 32
+
+# Entradas por nodo del árbol de cajas que usa la selección
+MAXIMO_ENTRADAS = 8
+MINIMO_ENTRADAS = 3
+
+# Con el área de recorte activa, los puntos visibles de círculos y curvas se
+# calculan una vez por figura y por rectángulo y se guardan; False vuelve a
+# probar cada punto en cada redibujado
+RECORTAR_AL_GUARDAR = True
+
+# Los círculos se muestrean con una potencia de dos de segmentos que deja los
+# puntos vecinos a lo sumo a LARGO_MAXIMO_CUERDA pixeles
+LARGO_MAXIMO_CUERDA = 2
+SEGMENTOS_MINIMOS = 16
+
+# Las curvas se aplanan con los segmentos justos para que la poligonal no se
+# separe de la curva más de TOLERANCIA_CURVA pixeles. Nunca menos de
+# SEGMENTOS_CURVA_MINIMOS: con 3 puntos se confundiría con los de control
+TOLERANCIA_CURVA = 0.25
+SEGMENTOS_CURVA_MINIMOS = 4
+
+# El borrador, la selección y el recorte solo prueban los puntos guardados de
+# una curva, así que al guardarla ningún tramo pasa de este largo en pixeles
+# (menos que medio borrador y que la tolerancia de la selección)
+LARGO_MAXIMO_TRAMO_CURVA = 5
+
+# Filas de la ventana que ocupa la barra de herramientas, incluida la línea
+# que la separa del lienzo
+ALTO_BARRA = 41
+
+# Tiempo mínimo entre dos redibujados; los eventos que llegan mientras tanto se
+# aplican al modelo y se muestran juntos en el siguiente cuadro
+PRESUPUESTO_CUADRO_MS = 16
+
+# Si el área dañada pasa de esta fracción del lienzo se repinta entero
+FRACCION_DANO_MAXIMA = 0.5
+
+# Margen de las zonas dañadas al mover el área de recorte: los puntos que
+# quedan en su borde sobresalen medio grosor (el grosor máximo es 10)
+MARGEN_RECORTE = 12
+
+# Orden en que la selección prueba los tipos de figura
+PRIORIDAD_SELECCION = {'circulo': 0, 'rectangulo': 1, 'linea': 2, 'curva': 3}
+
+# Orden en que dibujar_almacenados pinta los almacenes; dentro de cada uno las
+# figuras van por id
+ORDEN_DIBUJO = {tipo: orden for orden, tipo in enumerate(ALMACEN_DE_TIPO)}
+
 # matriz de transformacion de traslacion
 def crear_matriz_traslacion(tx, ty):
     return np.array([
@@ -47,11 +118,17 @@ def crear_matriz_escala(sx, sy):
         [0, 0, 1]
     ])
 
-def aplicar_transformacion(punto, matriz):
-    x, y = punto
-    punto_homogeneo = np.array([x, y, 1])
-    transformado = matriz.dot(punto_homogeneo)
-    return (transformado[0], transformado[1])
+# Aplica una matriz homogénea 3x3 a un arreglo de puntos (N, 2) en una sola
+# multiplicación, sin armar el vector (x, y, 1) de cada punto
+# Con una pila de matrices (K, 3, 3) los puntos van en (K, N, 2) y cada grupo
+# usa la suya. 'salida' es un arreglo ya reservado de la forma de los puntos
+# donde se escribe el resultado (puede ser el mismo 'puntos'); sin él se crea uno
+def transformar_puntos(puntos, matriz, salida=None):
+    puntos = np.asarray(puntos, dtype=np.float64) if salida is None else np.asarray(puntos)
+    matriz = np.asarray(matriz, dtype=np.float64)
+    salida = np.matmul(puntos, np.swapaxes(matriz[..., :2, :2], -1, -2), out=salida)
+    np.add(salida, matriz[..., np.newaxis, :2, 2], out=salida)
+    return salida
 
 # Función para inicializar Pygame y OpenGL
 def inicializar_pygame(ancho, alto):
@@ -66,7 +143,7 @@ def inicializar_pygame(ancho, alto):
     glMatrixMode(GL_MODELVIEW)
     glLoadIdentity()
     
-    return {
+    estado = {
         'ancho': ancho,
         'alto': alto,
         'dibujando': False,
@@ -75,11 +152,12 @@ def inicializar_pygame(ancho, alto):
         'grosor_linea': 3,
         'puntos': [],
         'puntos_control': [],
-        'pixeles_almacenados': [],
-        'lineas_almacenadas': [],
-        'curvas_almacenadas': [],
-        'circulos_almacenados': [],
-        'rectangulos_almacenados': [],
+        'capas': [nueva_capa(ancho, alto)],  # De abajo hacia arriba
+        'capa_activa': 0,
+        'trazo_actual': None,  # Id del trazo que se está dibujando con el lápiz
+        'siguiente_id': 0,  # Los ids son únicos entre todas las capas
+        'atlas_glifos': None,  # Textura con los caracteres del texto de la barra
+        'barra': {'clave': None, 'textura': None},  # Barra de herramientas ya dibujada
         'color_actual': (1.0, 0.0, 0.0),
         'mostrar_cuadricula': True,
         'tamanio_cuadricula': 20,
@@ -94,6 +172,63 @@ def inicializar_pygame(ancho, alto):
         'modo_corazon': None,  # None, 'centro1', 'radio1', 'centro2', 'radio2'
         'corazon_datos': {},   # Para guardar centros y radios temporales
     }
+    return activar_capa(estado, 0)
+
+# Una capa tiene sus propios almacenes, índices y lienzo (con fondo transparente)
+def nueva_capa(ancho, alto):
+    return {
+        'visible': True,
+        'opacidad': 1.0,
+        'trazos_almacenados': {},  # Trazos del lápiz: estilo + polilínea int16
+        'lineas_almacenadas': {},
+        'curvas_almacenadas': {},
+        'circulos_almacenados': {},
+        'rectangulos_almacenados': {},
+        'transformaciones': {},  # Figura original y matriz acumulada de las transformadas
+        'rejilla': nueva_rejilla(),  # Índice espacial para el borrador
+        'arbol_seleccion': nuevo_arbol(),  # Cajas de las figuras seleccionables
+        'arbol_dibujo': nuevo_arbol(),  # Cajas de los pixeles que pinta cada figura
+        'cache_recorte': {'area': None, 'figuras': {}},  # Puntos visibles por figura
+        'lienzo': crear_lienzo(ancho, alto),  # Geometría confirmada (None si no hay FBO)
+    }
+
+# Hace activa una capa: cierra el trazo abierto, quita la selección y enlaza
+# las claves de CLAVES_CAPA a las de la capa
+def activar_capa(estado, indice):
+    if 'trazos_almacenados' in estado:
+        estado = cerrar_trazo(estado)
+    estado['figura_seleccionada'] = None
+    estado['capa_activa'] = indice
+    capa = estado['capas'][indice]
+    for clave in CLAVES_CAPA:
+        estado[clave] = capa[clave]
+    return estado
+
+# Crea una capa encima de la activa y la activa
+def agregar_capa(estado):
+    indice = estado['capa_activa'] + 1
+    estado['capas'].insert(indice, nueva_capa(estado['ancho'], estado['alto']))
+    return activar_capa(estado, indice)
+
+# Sube (paso=1) o baja (paso=-1) la capa activa un lugar
+def mover_capa(estado, paso):
+    capas = estado['capas']
+    actual = estado['capa_activa']
+    destino = actual + paso
+    if 0 <= destino < len(capas):
+        capas[actual], capas[destino] = capas[destino], capas[actual]
+        estado['capa_activa'] = destino
+    return estado
+
+# Estado con el que se dibuja una capa: solo la activa tiene trazo abierto y
+# vista previa del recorte, así las demás no se vuelven a rasterizar
+def vista_capa(estado, indice):
+    if indice == estado['capa_activa']:
+        return estado
+    vista = dict(estado, **{clave: estado['capas'][indice][clave] for clave in CLAVES_CAPA})
+    vista['trazo_actual'] = None
+    vista['area_recorte'] = None
+    return vista
 
 # Función para dibujar la cuadrícula
 def dibujar_cuadricula(estado):
@@ -119,14 +254,282 @@ def establecer_color(estado, r, g, b):
     estado['color_actual'] = (r/255.0, g/255.0, b/255.0)
     return estado
 
+# Guarda una figura nueva en su almacén y en la rejilla; devuelve su id
+def agregar_figura(estado, tipo, figura):
+    id_figura = estado['siguiente_id']
+    estado['siguiente_id'] += 1
+    estado[ALMACEN_DE_TIPO[tipo]][id_figura] = figura
+    indexar_figura(estado, tipo, id_figura)
+    return id_figura
+
+# Reemplaza una figura existente (rotar, escalar, recortar) conservando su id
+# y su lugar en el orden de dibujo
+# Reemplazar y eliminar dañan en el lienzo la zona que ocupaba la figura (y la
+# que ocupa ahora), para repintar solo esa parte
+def reemplazar_figura(estado, tipo, id_figura, figura):
+    estado['transformaciones'].pop(id_figura, None)
+    danar_lienzo(estado, estado['arbol_dibujo']['cajas'].get((tipo, id_figura)))
+    estado[ALMACEN_DE_TIPO[tipo]][id_figura] = figura
+    indexar_figura(estado, tipo, id_figura)
+    danar_lienzo(estado, estado['arbol_dibujo']['cajas'].get((tipo, id_figura)))
+
+def eliminar_figura(estado, tipo, id_figura):
+    estado['transformaciones'].pop(id_figura, None)
+    danar_lienzo(estado, estado['arbol_dibujo']['cajas'].get((tipo, id_figura)))
+    del estado[ALMACEN_DE_TIPO[tipo]][id_figura]
+    desindexar_figura(estado, tipo, id_figura)
+    if estado['figura_seleccionada'] == (tipo, id_figura):
+        estado['figura_seleccionada'] = None
+
+# Rejilla uniforme para el borrador: cada celda de TAMANHO_CELDA pixeles guarda
+# las figuras (tipo, id) con algún punto clave dentro, y cada figura recuerda
+# sus celdas para poder sacarla sin recorrer la rejilla
+def nueva_rejilla():
+    return {'celdas': {}, 'figuras': {}}
+
+# Puntos que compara el borrador según el tipo de figura
+def puntos_clave(tipo, figura):
+    if tipo == 'trazo':
+        return pixeles_trazo(figura)
+    if tipo in ('linea', 'rectangulo'):
+        return [figura[0:2], figura[2:4]]
+    if tipo == 'circulo':
+        return [figura[0:2]] if len(figura) == 5 else figura[0]
+    return figura[0]
+
+def celdas_de_puntos(puntos):
+    if not isinstance(puntos, np.ndarray):
+        return {(int(x // TAMANHO_CELDA), int(y // TAMANHO_CELDA)) for x, y in puntos}
+    puntos = puntos.astype(np.float64).reshape(-1, 2)
+    celdas = np.unique(np.floor_divide(puntos, TAMANHO_CELDA).astype(np.int64), axis=0)
+    return set(map(tuple, celdas.tolist()))
+
+def agregar_celdas(estado, clave, celdas):
+    rejilla = estado['rejilla']
+    rejilla['figuras'].setdefault(clave, set()).update(celdas)
+    for celda in celdas:
+        rejilla['celdas'].setdefault(celda, set()).add(clave)
+
+def desindexar_figura(estado, tipo, id_figura):
+    rejilla = estado['rejilla']
+    clave = (tipo, id_figura)
+    quitar_de_arbol(estado['arbol_seleccion'], clave)
+    quitar_de_arbol(estado['arbol_dibujo'], clave)
+    estado['cache_recorte']['figuras'].pop(clave, None)
+    for celda in rejilla['figuras'].pop(clave, ()):
+        miembros = rejilla['celdas'][celda]
+        miembros.discard(clave)
+        if not miembros:
+            del rejilla['celdas'][celda]
+
+def indexar_figura(estado, tipo, id_figura):
+    desindexar_figura(estado, tipo, id_figura)
+    figura = estado[ALMACEN_DE_TIPO[tipo]][id_figura]
+    agregar_celdas(estado, (tipo, id_figura), celdas_de_puntos(puntos_clave(tipo, figura)))
+    caja = caja_seleccion(tipo, figura)
+    if caja is not None:
+        insertar_en_arbol(estado['arbol_seleccion'], (tipo, id_figura), caja)
+    insertar_en_arbol(estado['arbol_dibujo'], (tipo, id_figura), caja_dibujo(tipo, figura))
+
+# Figuras (tipo, id) registradas en las celdas que cubre el rectángulo
+def consultar_rejilla(estado, x0, y0, x1, y1):
+    celdas = estado['rejilla']['celdas']
+    encontradas = set()
+    for cx in range(int(x0 // TAMANHO_CELDA), int(x1 // TAMANHO_CELDA) + 1):
+        for cy in range(int(y0 // TAMANHO_CELDA), int(y1 // TAMANHO_CELDA) + 1):
+            encontradas |= celdas.get((cx, cy), set())
+    return encontradas
+
+# Árbol R de cajas envolventes para la selección. Cada nodo guarda entradas
+# [caja, hijo]; en las hojas el hijo es la clave (tipo, id) de la figura
+# Las cajas son (x0, y0, x1, y1) e incluyen la tolerancia de seleccionar_figura
+def nuevo_arbol():
+    return {'raiz': {'hoja': True, 'entradas': []}, 'cajas': {}}
+
+# Caja donde seleccionar_figura puede dar acierto; None si no es seleccionable
+def caja_seleccion(tipo, figura):
+    if tipo == 'circulo':
+        if len(figura) != 5:
+            return None
+        cx, cy, radio, color, grosor = figura
+        margen = radio + grosor
+        return (cx - margen, cy - margen, cx + margen, cy + margen)
+    if tipo == 'rectangulo':
+        x0, y0, x1, y1 = figura[:4]
+        return (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+    if tipo == 'linea':
+        x0, y0, x1, y1, color, grosor = figura
+        margen = grosor + 2
+        return (min(x0, x1) - margen, min(y0, y1) - margen, max(x0, x1) + margen, max(y0, y1) + margen)
+    if tipo == 'curva':
+        puntos, color, grosor = figura
+        if not len(puntos):
+            return None
+        xs = [p[0] for p in puntos]
+        ys = [p[1] for p in puntos]
+        margen = grosor + 5
+        return (min(xs) - margen, min(ys) - margen, max(xs) + margen, max(ys) + margen)
+    return None
+
+# Caja de los pixeles que puede pintar una figura, con un margen de un grosor
+# completo para cubrir los puntos y líneas anchas de los bordes
+def caja_dibujo(tipo, figura):
+    if tipo == 'trazo':
+        x0, y0, x1, y1 = figura['caja']
+        margen = figura['tamanho'] + 2
+    elif tipo in ('linea', 'rectangulo'):
+        x0, y0, x1, y1, color, grosor = figura
+        x0, x1, y0, y1 = min(x0, x1), max(x0, x1), min(y0, y1), max(y0, y1)
+        margen = grosor + 2
+    elif tipo == 'circulo' and len(figura) == 5:
+        cx, cy, radio, color, grosor = figura
+        x0, y0, x1, y1 = cx - abs(radio), cy - abs(radio), cx + abs(radio), cy + abs(radio)
+        margen = grosor + 2
+    else:
+        puntos, color, grosor = figura
+        puntos = np.asarray(puntos, dtype=np.float64).reshape(-1, 2)
+        if not len(puntos):
+            return (0, 0, 0, 0)
+        (x0, y0), (x1, y1) = puntos.min(axis=0).tolist(), puntos.max(axis=0).tolist()
+        margen = grosor + 2
+    return (x0 - margen, y0 - margen, x1 + margen, y1 + margen)
+
+def unir_cajas(a, b):
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+def area_caja(caja):
+    return (caja[2] - caja[0]) * (caja[3] - caja[1])
+
+def cajas_se_tocan(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+def caja_contiene(a, b):
+    return a[0] <= b[0] and a[1] <= b[1] and b[2] <= a[2] and b[3] <= a[3]
+
+def caja_de_nodo(nodo):
+    caja = nodo['entradas'][0][0]
+    for otra, _ in nodo['entradas'][1:]:
+        caja = unir_cajas(caja, otra)
+    return caja
+
+# Reparto cuadrático de Guttman: las dos entradas que más área desperdician
+# juntas arrancan cada grupo y el resto va al grupo que menos crece
+def dividir_nodo(nodo):
+    entradas = nodo['entradas']
+    _, i, j = max(
+        (area_caja(unir_cajas(entradas[i][0], entradas[j][0])) - area_caja(entradas[i][0]) - area_caja(entradas[j][0]), i, j)
+        for i in range(len(entradas)) for j in range(i + 1, len(entradas))
+    )
+    grupos = [[entradas[i]], [entradas[j]]]
+    cajas = [entradas[i][0], entradas[j][0]]
+    restantes = [e for k, e in enumerate(entradas) if k not in (i, j)]
+    for k, entrada in enumerate(restantes):
+        faltan = len(restantes) - k
+        if len(grupos[0]) + faltan == MINIMO_ENTRADAS:
+            destino = 0
+        elif len(grupos[1]) + faltan == MINIMO_ENTRADAS:
+            destino = 1
+        else:
+            crecimiento = [area_caja(unir_cajas(c, entrada[0])) - area_caja(c) for c in cajas]
+            destino = 0 if (crecimiento[0], area_caja(cajas[0])) <= (crecimiento[1], area_caja(cajas[1])) else 1
+        grupos[destino].append(entrada)
+        cajas[destino] = unir_cajas(cajas[destino], entrada[0])
+    nodo['entradas'] = grupos[0]
+    return {'hoja': nodo['hoja'], 'entradas': grupos[1]}
+
+# Baja por el hijo que menos tiene que crecer; devuelve el nodo nuevo si hubo
+# que dividir
+def insertar_en_nodo(nodo, caja, valor):
+    if nodo['hoja']:
+        nodo['entradas'].append([caja, valor])
+    else:
+        entrada = min(nodo['entradas'], key=lambda e: (
+            area_caja(unir_cajas(e[0], caja)) - area_caja(e[0]), area_caja(e[0])))
+        entrada[0] = unir_cajas(entrada[0], caja)
+        nuevo = insertar_en_nodo(entrada[1], caja, valor)
+        if nuevo is not None:
+            entrada[0] = caja_de_nodo(entrada[1])
+            nodo['entradas'].append([caja_de_nodo(nuevo), nuevo])
+    if len(nodo['entradas']) > MAXIMO_ENTRADAS:
+        return dividir_nodo(nodo)
+    return None
+
+def insertar_en_arbol(arbol, clave, caja):
+    quitar_de_arbol(arbol, clave)
+    arbol['cajas'][clave] = caja
+    raiz = arbol['raiz']
+    nuevo = insertar_en_nodo(raiz, caja, clave)
+    if nuevo is not None:
+        arbol['raiz'] = {'hoja': False, 'entradas': [[caja_de_nodo(raiz), raiz], [caja_de_nodo(nuevo), nuevo]]}
+
+def claves_de_nodo(nodo):
+    if nodo['hoja']:
+        return list(nodo['entradas'])
+    return [e for _, hijo in nodo['entradas'] for e in claves_de_nodo(hijo)]
+
+# Quita la clave del subárbol; los nodos que quedan con menos de
+# MINIMO_ENTRADAS se deshacen y sus hojas se guardan en 'huerfanas'
+def quitar_de_nodo(nodo, caja, clave, huerfanas):
+    if nodo['hoja']:
+        for k, (_, valor) in enumerate(nodo['entradas']):
+            if valor == clave:
+                del nodo['entradas'][k]
+                return True
+        return False
+    for k, entrada in enumerate(nodo['entradas']):
+        if caja_contiene(entrada[0], caja) and quitar_de_nodo(entrada[1], caja, clave, huerfanas):
+            if len(entrada[1]['entradas']) < MINIMO_ENTRADAS:
+                del nodo['entradas'][k]
+                huerfanas.extend(claves_de_nodo(entrada[1]))
+            else:
+                entrada[0] = caja_de_nodo(entrada[1])
+            return True
+    return False
+
+def quitar_de_arbol(arbol, clave):
+    caja = arbol['cajas'].pop(clave, None)
+    if caja is None:
+        return
+    huerfanas = []
+    quitar_de_nodo(arbol['raiz'], caja, clave, huerfanas)
+    while not arbol['raiz']['hoja'] and len(arbol['raiz']['entradas']) == 1:
+        arbol['raiz'] = arbol['raiz']['entradas'][0][1]
+    if not arbol['raiz']['entradas']:
+        arbol['raiz'] = {'hoja': True, 'entradas': []}
+    for caja_huerfana, clave_huerfana in huerfanas:
+        raiz = arbol['raiz']
+        nuevo = insertar_en_nodo(raiz, caja_huerfana, clave_huerfana)
+        if nuevo is not None:
+            arbol['raiz'] = {'hoja': False, 'entradas': [[caja_de_nodo(raiz), raiz], [caja_de_nodo(nuevo), nuevo]]}
+
+# Claves (tipo, id) cuya caja toca el rectángulo; un punto es un rectángulo
+# de tamaño cero
+def consultar_arbol(arbol, x0, y0, x1, y1):
+    consulta = (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+    encontradas = []
+    pendientes = [arbol['raiz']]
+    while pendientes:
+        nodo = pendientes.pop()
+        for caja, hijo in nodo['entradas']:
+            if cajas_se_tocan(caja, consulta):
+                if nodo['hoja']:
+                    encontradas.append(hijo)
+                else:
+                    pendientes.append(hijo)
+    return encontradas
+
 # Establacer los pixeles de las figuras
+# Con almacenar=True (los eventos del ratón) solo se guarda la figura, sin
+# tocar OpenGL: se ve en el siguiente cuadro, que la dibuja desde su almacén.
+# Lo mismo vale para las demás funciones dibujar_* con 'almacenar'
 def dibujar_pixel(estado, x, y, almacenar=True, color=None, tamanho=None):
     if color is None:
         color = estado['color_actual']
     if tamanho is None:
         tamanho = estado['grosor_linea']
     if almacenar:
-        estado['pixeles_almacenados'].append((x, y, color, tamanho))
+        agregar_punto_trazo(estado, x, y, color, tamanho)
+        return estado
     glColor3f(*color)
     glPointSize(tamanho)
     glBegin(GL_POINTS)
@@ -135,38 +538,166 @@ def dibujar_pixel(estado, x, y, almacenar=True, color=None, tamanho=None):
     glPointSize(1)
     return estado
 
+# Los trazos del lápiz se guardan como polilíneas: un registro de estilo y las
+# muestras del ratón empaquetadas en un arreglo int16 (N, 2), con su caja
+# envolvente. Los pixeles se obtienen interpolando entre muestras al dibujar
+def nuevo_trazo(puntos, color, tamanho):
+    puntos = np.asarray(puntos, dtype=np.int16).reshape(-1, 2)
+    return {
+        'color': color,
+        'tamanho': tamanho,
+        'puntos': puntos,
+        'total': len(puntos),
+        'caja': [int(puntos[:, 0].min()), int(puntos[:, 1].min()),
+                 int(puntos[:, 0].max()), int(puntos[:, 1].max())],
+    }
+
+# Añade una muestra al trazo actual; empieza uno nuevo si no hay trazo abierto
+# o cambió el estilo. El arreglo crece al doble cuando se llena
+def agregar_punto_trazo(estado, x, y, color, tamanho):
+    id_trazo = estado['trazo_actual']
+    trazo = estado['trazos_almacenados'].get(id_trazo)
+    if trazo is None or trazo['color'] != color or trazo['tamanho'] != tamanho:
+        trazo = nuevo_trazo([(x, y)], color, tamanho)
+        trazo['puntos'] = np.resize(trazo['puntos'], (64, 2))
+        estado['trazo_actual'] = agregar_figura(estado, 'trazo', trazo)
+        return estado
+    if trazo['total'] == len(trazo['puntos']):
+        trazo['puntos'] = np.concatenate([trazo['puntos'], np.empty_like(trazo['puntos'])])
+    trazo['puntos'][trazo['total']] = (x, y)
+    trazo['total'] += 1
+    caja = trazo['caja']
+    caja[0], caja[1] = min(caja[0], x), min(caja[1], y)
+    caja[2], caja[3] = max(caja[2], x), max(caja[3], y)
+    # Solo se indexan las celdas del segmento nuevo
+    segmento = rasterizar_polilineas([trazo['puntos'][trazo['total'] - 2:trazo['total']]])
+    agregar_celdas(estado, ('trazo', id_trazo), celdas_de_puntos(segmento))
+    if not caja_contiene(estado['arbol_dibujo']['cajas'][('trazo', id_trazo)], caja_dibujo('trazo', trazo)):
+        insertar_en_arbol(estado['arbol_dibujo'], ('trazo', id_trazo), caja_dibujo('trazo', trazo))
+    return estado
+
+# Cierra el trazo actual y recorta la capacidad sobrante de su arreglo
+def cerrar_trazo(estado):
+    trazo = estado['trazos_almacenados'].get(estado['trazo_actual'])
+    if trazo is not None:
+        trazo['puntos'] = trazo['puntos'][:trazo['total']].copy()
+    estado['trazo_actual'] = None
+    return estado
+
+# Rasteriza varias polilíneas de una vez interpolando cada segmento con
+# max(|dx|, |dy|) pasos, así el trazo no tiene huecos aunque el ratón vaya rápido
+def rasterizar_polilineas(polilineas):
+    polilineas = [np.asarray(p, dtype=np.int32) for p in polilineas if len(p)]
+    if not polilineas:
+        return np.empty((0, 2), dtype=np.int32)
+    inicios = np.concatenate([p[:-1] for p in polilineas])
+    diferencias = np.concatenate([p[1:] for p in polilineas]) - inicios
+    pasos = np.abs(diferencias).max(axis=1)
+
+    # Cada segmento aporta sus puntos sin el final, que es el inicio del siguiente
+    segmento = np.repeat(np.arange(len(pasos)), pasos)
+    k = np.arange(len(segmento)) - np.repeat(np.cumsum(pasos) - pasos, pasos)
+    t = (k / np.maximum(pasos[segmento], 1))[:, None]
+    interpolados = inicios[segmento] + np.rint(diferencias[segmento] * t).astype(np.int32)
+    ultimos = np.array([p[-1] for p in polilineas], dtype=np.int32)
+    return np.concatenate([interpolados, ultimos])
+
+# Pixeles de un trazo en orden a lo largo del recorrido
+def pixeles_trazo(trazo):
+    return rasterizar_polilineas([trazo['puntos'][:trazo['total']]])
+
+# Aplica una máscara por trazo: conservar(pixeles) -> bool por pixel
+# Los trazos que pierden pixeles se parten en los tramos que quedan, así el
+# borrado y el recorte trabajan por trazo y no por pixel. Con 'ids' solo se
+# revisan esos trazos
+# Devuelve cuántos trazos cambiaron
+def filtrar_trazos(estado, conservar, ids=None):
+    estado = cerrar_trazo(estado)
+    if ids is None:
+        ids = list(estado['trazos_almacenados'])
+    cambiados = 0
+    for id_trazo in ids:
+        trazo = estado['trazos_almacenados'][id_trazo]
+        pixeles = pixeles_trazo(trazo)
+        mascara = conservar(pixeles)
+        if mascara.all():
+            continue
+        cambiados += 1
+        eliminar_figura(estado, 'trazo', id_trazo)
+        bordes = np.flatnonzero(np.diff(np.concatenate([[0], mascara.astype(np.int8), [0]])))
+        for inicio, fin in zip(bordes[::2], bordes[1::2]):
+            agregar_figura(estado, 'trazo', nuevo_trazo(pixeles[inicio:fin], trazo['color'], trazo['tamanho']))
+    return cambiados
+
+# Dibuja trazos agrupando los seguidos del mismo estilo: una rasterización y un
+# glDrawArrays por tramo, así un trazo nunca pasa por encima de otro posterior
+# Cada elemento es (trazo, desde_muestra)
+def dibujar_trazos(trazos):
+    for (color, tamanho), tramo in groupby(trazos, key=lambda t: (t[0]['color'], t[0]['tamanho'])):
+        polilineas = [trazo['puntos'][max(desde - 1, 0):trazo['total']] for trazo, desde in tramo]
+        dibujar_arreglo_puntos(rasterizar_polilineas(polilineas), color, tamanho)
+
+# Dibuja un arreglo de puntos (N, 2) con una sola llamada a glDrawArrays
+def dibujar_arreglo_puntos(puntos, color, tamanho):
+    if len(puntos) == 0:
+        return
+    glColor3f(*color)
+    glPointSize(tamanho)
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glVertexPointer(2, GL_INT if puntos.dtype == np.int32 else GL_FLOAT, 0, puntos)
+    glDrawArrays(GL_POINTS, 0, len(puntos))
+    glDisableClientState(GL_VERTEX_ARRAY)
+    glPointSize(1)
+
+# Dibuja un arreglo de puntos (N, 2) como una línea abierta
+def dibujar_arreglo_linea(puntos, color, grosor):
+    glColor3f(*color)
+    glLineWidth(grosor)
+    if len(puntos):
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(2, GL_FLOAT, 0, puntos)
+        glDrawArrays(GL_LINE_STRIP, 0, len(puntos))
+        glDisableClientState(GL_VERTEX_ARRAY)
+    glLineWidth(1)
+
 # Borrar en un area los pixeles
+# Solo se revisan las figuras registradas en las celdas que cubre el borrador
 def borrar_en(estado, x, y):
     mitad = estado['tamanho_borrador'] // 2
-    estado['pixeles_almacenados'] = [
-        (px, py, color, tamaño) for (px, py, color, tamaño) in estado['pixeles_almacenados']
-        if not (x - mitad <= px <= x + mitad and y - mitad <= py <= y + mitad)
-    ]
-    estado['lineas_almacenadas'] = [
-        linea for linea in estado['lineas_almacenadas']
-        if not ((x - mitad <= linea[0] <= x + mitad and y - mitad <= linea[1] <= y + mitad) or
-                (x - mitad <= linea[2] <= x + mitad and y - mitad <= linea[3] <= y + mitad))
-    ]
-    estado['circulos_almacenados'] = [
-        circulo for circulo in estado['circulos_almacenados']
-        if ((len(circulo) == 5 and not (x - mitad <= circulo[0] <= x + mitad and y - mitad <= circulo[1] <= y + mitad)))
-        or (len(circulo) == 3 and not any(x - mitad <= px <= x + mitad and y - mitad <= py <= y + mitad for (px, py) in circulo[0]))
-    ]
-    estado['curvas_almacenadas'] = [
-        curva for curva in estado['curvas_almacenadas']
-        if not any(x - mitad <= px <= x + mitad and y - mitad <= py <= y + mitad for (px, py) in curva[0])
-    ]
-    estado['rectangulos_almacenados'] = [
-        rect for rect in estado['rectangulos_almacenados']
-        if not ((x - mitad <= rect[0] <= x + mitad and y - mitad <= rect[1] <= y + mitad) or
-                (x - mitad <= rect[2] <= x + mitad and y - mitad <= rect[3] <= y + mitad))
-    ]
+    x0, y0, x1, y1 = x - mitad, y - mitad, x + mitad, y + mitad
+
+    def dentro(px, py):
+        return x0 <= px <= x1 and y0 <= py <= y1
+
+    trazos = []
+    for tipo, id_figura in sorted(consultar_rejilla(estado, x0, y0, x1, y1)):
+        figura = estado[ALMACEN_DE_TIPO[tipo]][id_figura]
+        if tipo == 'trazo':
+            trazos.append(id_figura)
+            continue
+        if tipo in ('linea', 'rectangulo'):
+            borrar = dentro(figura[0], figura[1]) or dentro(figura[2], figura[3])
+        elif tipo == 'circulo' and len(figura) == 5:
+            borrar = dentro(figura[0], figura[1])
+        else:
+            borrar = any(dentro(px, py) for (px, py) in figura[0])
+        if borrar:
+            eliminar_figura(estado, tipo, id_figura)
+
+    if trazos:
+        filtrar_trazos(estado, lambda p: ~(
+            (x0 <= p[:, 0]) & (p[:, 0] <= x1) & (y0 <= p[:, 1]) & (p[:, 1] <= y1)), trazos)
     return estado
 
 # Dibujar una linea con Bresenham
-def dibujar_linea_bresenham(estado, x0, y0, x1, y1, almacenar=True):
+def dibujar_linea_bresenham(estado, x0, y0, x1, y1, almacenar=True, color=None, grosor=None):
+    if color is None:
+        color = estado['color_actual']
+    if grosor is None:
+        grosor = estado['grosor_linea']
     if almacenar:
-        estado['lineas_almacenadas'].append((x0, y0, x1, y1, estado['color_actual'], estado['grosor_linea']))
+        agregar_figura(estado, 'linea', (x0, y0, x1, y1, color, grosor))
+        return estado
     
     dx = abs(x1 - x0)
     dy = abs(y1 - y0)
@@ -184,8 +715,8 @@ def dibujar_linea_bresenham(estado, x0, y0, x1, y1, almacenar=True):
     paso_y = 1 if y0 < y1 else -1
     y = y0
     
-    glColor3f(*estado['color_actual'])
-    glPointSize(estado['grosor_linea'])
+    glColor3f(*color)
+    glPointSize(grosor)
     glBegin(GL_POINTS)
     for x in range(int(x0), int(x1) + 1):
         coord = (y, x) if empinada else (x, y)
@@ -198,27 +729,66 @@ def dibujar_linea_bresenham(estado, x0, y0, x1, y1, almacenar=True):
     glPointSize(1)
     return estado
 
+# Tabla (cos, sin) del círculo unitario compartida por todos los círculos
+# Se guarda una sola, la más fina pedida; las tablas con menos segmentos son
+# vistas con paso sobre ella porque todas las cantidades son potencias de dos
+tabla_circulo = np.array([[1.0, 0.0]])
+
+# Segmentos de un círculo según su radio; dibujo, recorte y selección usan esta
+# misma cantidad
+def segmentos_circulo(radio):
+    segmentos = 2 * math.pi * abs(radio) / LARGO_MAXIMO_CUERDA
+    if segmentos <= SEGMENTOS_MINIMOS:
+        return SEGMENTOS_MINIMOS
+    return 1 << math.ceil(math.log2(segmentos))
+
+def tabla_unitaria(segmentos):
+    global tabla_circulo
+    if len(tabla_circulo) < segmentos:
+        angulos = np.arange(segmentos) * (2 * math.pi / segmentos)
+        tabla_circulo = np.column_stack([np.cos(angulos), np.sin(angulos)])
+    return tabla_circulo[::len(tabla_circulo) // segmentos]
+
+# Puntos (N, 2) de varios círculos (cx, cy, radio) con la misma cantidad de
+# segmentos: la tabla se escala y traslada para todos a la vez
+def puntos_circulos(circulos, segmentos):
+    circulos = np.asarray(circulos, dtype=np.float64).reshape(-1, 3)
+    tabla = tabla_unitaria(segmentos)
+    puntos = circulos[:, None, :2] + circulos[:, None, 2:3] * tabla[None, :, :]
+    return puntos.reshape(-1, 2)
+
+def puntos_circulo(cx, cy, radio):
+    return puntos_circulos([(cx, cy, radio)], segmentos_circulo(radio))
+
+# Dibuja círculos con un glDrawArrays por tramo de círculos seguidos del mismo
+# estilo, así se respeta el orden de creación. Cada uno es (cx, cy, radio,
+# color, grosor) o, si ya está recortado, (puntos, color, grosor); en cada
+# tramo los completos de igual cantidad de segmentos se muestrean juntos
+def dibujar_circulos(circulos):
+    for (color, grosor), tramo in groupby(circulos, key=lambda c: (c[-2], c[-1])):
+        por_segmentos = {}
+        sueltos = []
+        for circulo in tramo:
+            if len(circulo) == 5:
+                por_segmentos.setdefault(segmentos_circulo(circulo[2]), []).append(circulo[:3])
+            else:
+                sueltos.append(np.asarray(circulo[0], dtype=np.float64).reshape(-1, 2))
+        puntos = [puntos_circulos(c, n) for n, c in por_segmentos.items()] + sueltos
+        dibujar_arreglo_puntos(np.concatenate(puntos).astype(np.float32), color, grosor)
+
 # Dibujar un circulo con puntos y parametrizacion con angulos
-def dibujar_circulo(estado, cx, cy, radio, segmentos=100, almacenar=True):
+def dibujar_circulo(estado, cx, cy, radio, almacenar=True):
     if almacenar:
-        estado['circulos_almacenados'].append((cx, cy, radio, estado['color_actual'], estado['grosor_linea']))
-    
-    glColor3f(*estado['color_actual'])
-    glPointSize(estado['grosor_linea'])
-    glBegin(GL_POINTS)
-    for i in range(segmentos):
-        angulo = 2 * math.pi * i / segmentos
-        x = cx + radio * math.cos(angulo)
-        y = cy + radio * math.sin(angulo)
-        glVertex2f(x, y)
-    glEnd()
-    glPointSize(1)
+        agregar_figura(estado, 'circulo', (cx, cy, radio, estado['color_actual'], estado['grosor_linea']))
+        return estado
+    dibujar_circulos([(cx, cy, radio, estado['color_actual'], estado['grosor_linea'])])
     return estado
 
 # Dibujar un rectangulo funcion deshabilidada
 def dibujar_rectangulo(estado, x0, y0, x1, y1, almacenar=True):
     if almacenar:
-        estado['rectangulos_almacenados'].append((x0, y0, x1, y1, estado['color_actual'], estado['grosor_linea']))
+        agregar_figura(estado, 'rectangulo', (x0, y0, x1, y1, estado['color_actual'], estado['grosor_linea']))
+        return estado
     glColor3f(*estado['color_actual'])
     glLineWidth(estado['grosor_linea'])
     glBegin(GL_LINE_LOOP)
@@ -282,6 +852,65 @@ def recortar_linea_cohen_sutherland(x0, y0, x1, y1, rectangulo_recorte):
         return (x0, y0, x1, y1)
     return None
 
+# Códigos de Cohen-Sutherland de muchos puntos a la vez
+def calcular_codigos(x, y, rectangulo_recorte):
+    codigo = np.where(x < rectangulo_recorte[0], IZQUIERDA, np.where(x > rectangulo_recorte[2], DERECHA, DENTRO))
+    codigo |= np.where(y < rectangulo_recorte[1], ABAJO, np.where(y > rectangulo_recorte[3], ARRIBA, DENTRO))
+    return codigo
+
+# Cohen-Sutherland por lotes: segmentos es un arreglo (N, 4) de x0, y0, x1, y1
+# Cada vuelta trata a la vez todos los segmentos que siguen pendientes con las
+# mismas operaciones que recortar_linea_cohen_sutherland, así el resultado es
+# idéntico al de la versión de una línea
+# Devuelve (recortados, aceptados): los segmentos recortados (N, 4) y una
+# máscara con los que quedan dentro
+def recortar_segmentos(segmentos, rectangulo_recorte):
+    recortados = np.array(segmentos, dtype=np.float64).reshape(-1, 4)
+    aceptados = np.zeros(len(recortados), dtype=bool)
+    xmin, ymin, xmax, ymax = rectangulo_recorte
+    codigo0 = calcular_codigos(recortados[:, 0], recortados[:, 1], rectangulo_recorte)
+    codigo1 = calcular_codigos(recortados[:, 2], recortados[:, 3], rectangulo_recorte)
+    pendientes = np.arange(len(recortados))
+
+    while len(pendientes):
+        c0, c1 = codigo0[pendientes], codigo1[pendientes]
+        aceptar = (c0 | c1) == 0
+        aceptados[pendientes[aceptar]] = True
+        seguir = ~aceptar & ((c0 & c1) == 0)
+        pendientes, c0, c1 = pendientes[seguir], c0[seguir], c1[seguir]
+        if not len(pendientes):
+            break
+
+        x0, y0, x1, y1 = recortados[pendientes].T
+        codigo_fuera = np.where(c0 != 0, c0, c1)
+        arriba = (codigo_fuera & ARRIBA) != 0
+        abajo = ~arriba & ((codigo_fuera & ABAJO) != 0)
+        derecha = ~arriba & ~abajo & ((codigo_fuera & DERECHA) != 0)
+        # Las divisiones por cero solo ocurren en filas que no usan ese borde
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x = np.where(arriba, x0 + (x1 - x0) * (ymax - y0) / (y1 - y0),
+                np.where(abajo, x0 + (x1 - x0) * (ymin - y0) / (y1 - y0),
+                np.where(derecha, xmax, xmin)))
+            y = np.where(arriba, ymax, np.where(abajo, ymin,
+                np.where(derecha, y0 + (y1 - y0) * (xmax - x0) / (x1 - x0),
+                y0 + (y1 - y0) * (xmin - x0) / (x1 - x0))))
+
+        inicio = codigo_fuera == c0
+        filas = pendientes[inicio]
+        recortados[filas, 0], recortados[filas, 1] = x[inicio], y[inicio]
+        codigo0[filas] = calcular_codigos(x[inicio], y[inicio], rectangulo_recorte)
+        filas = pendientes[~inicio]
+        recortados[filas, 2], recortados[filas, 3] = x[~inicio], y[~inicio]
+        codigo1[filas] = calcular_codigos(x[~inicio], y[~inicio], rectangulo_recorte)
+
+    return recortados, aceptados
+
+# Máscara de los puntos (N, 2) que caen dentro del rectángulo, bordes incluidos
+def puntos_dentro(puntos, rectangulo_recorte):
+    puntos = np.asarray(puntos, dtype=np.float64).reshape(-1, 2)
+    x0, y0, x1, y1 = rectangulo_recorte
+    return (x0 <= puntos[:, 0]) & (puntos[:, 0] <= x1) & (y0 <= puntos[:, 1]) & (puntos[:, 1] <= y1)
+
 # Funciones para verificar los puntos que hay en las figuras
 def punto_en_circulo(punto, centro, radio):
     distancia = math.hypot(punto[0] - centro[0], punto[1] - centro[1])
@@ -312,30 +941,77 @@ def punto_en_linea(punto, linea, umbral=5):
     return distancia <= umbral
 
 # Seleccionar una figura en el area de recorte 
+# El árbol de cajas da los candidatos bajo el cursor y solo a esos se les hace
+# la prueba exacta, en el mismo orden de siempre: círculos, rectángulos,
+# líneas y curvas, y dentro de cada tipo la figura más antigua
 def seleccionar_figura(estado, x, y):
-    for i, circulo in enumerate(estado['circulos_almacenados']):
-        cx, cy, radio, color, grosor = circulo
-        if punto_en_circulo((x, y), (cx, cy), radio + grosor):
-            return ('circulo', i)
-    
-    for i, rect in enumerate(estado['rectangulos_almacenados']):
-        x0, y0, x1, y1, color, grosor = rect
-        if punto_en_rectangulo((x, y), (x0, y0, x1, y1)):
-            return ('rectangulo', i)
-    
-    for i, linea in enumerate(estado['lineas_almacenadas']):
-        x0, y0, x1, y1, color, grosor = linea
-        if punto_en_linea((x, y), (x0, y0, x1, y1), grosor + 2):
-            return ('linea', i)
-    
-    for i, curva in enumerate(estado['curvas_almacenadas']):
-        puntos_control, color, grosor = curva
-        for px, py in puntos_control:
-            if math.hypot(x - px, y - py) <= grosor + 5:
-                return ('curva', i)
+    candidatos = consultar_arbol(estado['arbol_seleccion'], x, y, x, y)
+    for tipo, i in sorted(candidatos, key=lambda c: (PRIORIDAD_SELECCION[c[0]], c[1])):
+        figura = estado[ALMACEN_DE_TIPO[tipo]][i]
+        if tipo == 'circulo':
+            cx, cy, radio, color, grosor = figura
+            if punto_en_circulo((x, y), (cx, cy), radio + grosor):
+                return ('circulo', i)
+        elif tipo == 'rectangulo':
+            x0, y0, x1, y1, color, grosor = figura
+            if punto_en_rectangulo((x, y), (x0, y0, x1, y1)):
+                return ('rectangulo', i)
+        elif tipo == 'linea':
+            x0, y0, x1, y1, color, grosor = figura
+            if punto_en_linea((x, y), (x0, y0, x1, y1), grosor + 2):
+                return ('linea', i)
+        else:
+            puntos_control, color, grosor = figura
+            for px, py in puntos_control:
+                if math.hypot(x - px, y - py) <= grosor + 5:
+                    return ('curva', i)
     
     return None
 
+# Selección por marco: figuras (tipo, id) cuya caja toca el rectángulo, en el
+# orden de prioridad de seleccionar_figura
+def seleccionar_en_area(estado, x0, y0, x1, y1):
+    candidatos = consultar_arbol(estado['arbol_seleccion'], x0, y0, x1, y1)
+    return sorted(candidatos, key=lambda c: (PRIORIDAD_SELECCION[c[0]], c[1]))
+
+# Centro de la figura alrededor del cual se rota y se escala
+def centro_figura(tipo, figura):
+    if tipo == 'circulo':
+        return figura[0], figura[1]
+    if tipo == 'curva':
+        centro_x, centro_y = np.asarray(figura[0], dtype=np.float64).reshape(-1, 2).mean(axis=0)
+        return centro_x, centro_y
+    x0, y0, x1, y1 = figura[:4]
+    return (x0 + x1) / 2, (y0 + y1) / 2
+
+# Figura con la matriz aplicada: todos sus puntos se transforman en una sola
+# multiplicación. Los círculos solo giran y se escalan de forma uniforme, así
+# que siguen siendo círculos con el radio escalado
+def figura_transformada(tipo, figura, matriz):
+    if tipo == 'circulo':
+        cx, cy, radio, color, grosor = figura
+        centro_x, centro_y = transformar_puntos([[cx, cy]], matriz)[0].tolist()
+        return (centro_x, centro_y, radio * math.sqrt(abs(np.linalg.det(matriz[:2, :2]))), color, grosor)
+    if tipo == 'curva':
+        puntos_control, color, grosor = figura
+        puntos = np.asarray(puntos_control, dtype=np.float64).reshape(-1, 2)
+        return ([tuple(p) for p in transformar_puntos(puntos, matriz).tolist()], color, grosor)
+    x0, y0, x1, y1, color, grosor = figura
+    esquinas = transformar_puntos([[x0, y0], [x1, y1]], matriz)
+    return (*esquinas.ravel().tolist(), color, grosor)
+
+# Las figuras rotadas o escaladas guardan en 'transformaciones' su forma
+# original y la matriz acumulada {id: (figura, matriz)}. Cada transformación
+# solo multiplica la matriz y las coordenadas del almacén se calculan siempre
+# desde la original, así repetir giros no acumula error
+# Cualquier otro cambio (recortar, borrar) vuelve a hacer original a la figura
+def transformar_figura(estado, tipo, id_figura, matriz):
+    figura = estado[ALMACEN_DE_TIPO[tipo]][id_figura]
+    original, acumulada = estado['transformaciones'].get(id_figura, (figura, np.identity(3)))
+    acumulada = matriz.dot(acumulada)
+    reemplazar_figura(estado, tipo, id_figura, figura_transformada(tipo, original, acumulada))
+    estado['transformaciones'][id_figura] = (original, acumulada)
+
 # Funcion de rotar en base a la matriz de transformacion segun el tipo de figura
 # Se aplica una matriz de rotación en base al centro de la figura
 def rotar_figura(estado, angulo):
@@ -343,122 +1019,28 @@ def rotar_figura(estado, angulo):
         return estado
     
     tipo, indice = estado['figura_seleccionada']
+    centro_x, centro_y = centro_figura(tipo, estado[ALMACEN_DE_TIPO[tipo]][indice])
     
-    if tipo == 'circulo':
-        cx, cy, radio, color, grosor = estado['circulos_almacenados'][indice]
-        centro_x, centro_y = cx, cy
-        
-        T1 = crear_matriz_traslacion(-centro_x, -centro_y)
-        R = crear_matriz_rotacion(angulo)
-        T2 = crear_matriz_traslacion(centro_x, centro_y)
-        M = T2.dot(R).dot(T1)
-        
-        nuevo_cx, nuevo_cy = aplicar_transformacion((cx, cy), M)
-        estado['circulos_almacenados'][indice] = (nuevo_cx, nuevo_cy, radio, color, grosor)
-    
-    elif tipo == 'rectangulo':
-        x0, y0, x1, y1, color, grosor = estado['rectangulos_almacenados'][indice]
-        centro_x = (
-            
-        ) / 2
-        centro_y = (y0 + y1) / 2
-        
-        T1 = crear_matriz_traslacion(-centro_x, -centro_y)
-        R = crear_matriz_rotacion(angulo)
-        T2 = crear_matriz_traslacion(centro_x, centro_y)
-        M = T2.dot(R).dot(T1)
-        
-        x0n, y0n = aplicar_transformacion((x0, y0), M)
-        x1n, y1n = aplicar_transformacion((x1, y1), M)
-        
-        estado['rectangulos_almacenados'][indice] = (x0n, y0n, x1n, y1n, color, grosor)
-    
-    elif tipo == 'linea':
-        x0, y0, x1, y1, color, grosor = estado['lineas_almacenadas'][indice]
-        centro_x = (x0 + x1) / 2
-        centro_y = (y0 + y1) / 2
-        
-        T1 = crear_matriz_traslacion(-centro_x, -centro_y)
-        R = crear_matriz_rotacion(angulo)
-        T2 = crear_matriz_traslacion(centro_x, centro_y)
-        M = T2.dot(R).dot(T1)
-        
-        x0n, y0n = aplicar_transformacion((x0, y0), M)
-        x1n, y1n = aplicar_transformacion((x1, y1), M)
-        
-        estado['lineas_almacenadas'][indice] = (x0n, y0n, x1n, y1n, color, grosor)
-    
-    elif tipo == 'curva':
-        puntos_control, color, grosor = estado['curvas_almacenadas'][indice]
-        centro_x = sum(p[0] for p in puntos_control) / len(puntos_control)
-        centro_y = sum(p[1] for p in puntos_control) / len(puntos_control)
-        
-        T1 = crear_matriz_traslacion(-centro_x, -centro_y)
-        R = crear_matriz_rotacion(angulo)
-        T2 = crear_matriz_traslacion(centro_x, centro_y)
-        M = T2.dot(R).dot(T1)
-        
-        nuevos_puntos = [aplicar_transformacion(p, M) for p in puntos_control]
-        estado['curvas_almacenadas'][indice] = (nuevos_puntos, color, grosor)
+    T1 = crear_matriz_traslacion(-centro_x, -centro_y)
+    R = crear_matriz_rotacion(angulo)
+    T2 = crear_matriz_traslacion(centro_x, centro_y)
+    transformar_figura(estado, tipo, indice, T2.dot(R).dot(T1))
     
     return estado
 
-# Escala la figura seleccionada dependiento de la figura
-# Se aplica una matriz de escala en base al centro de la figura
-# y se actualizan las coordenadas de la figura almacenada
+# Escala la figura seleccionada en base a su centro con una matriz de escala
 def escalar_figura(estado, factor):
     if not estado['figura_seleccionada']:
         return estado
     
     tipo, indice = estado['figura_seleccionada']
     estado['factor_escala'] *= factor
+    centro_x, centro_y = centro_figura(tipo, estado[ALMACEN_DE_TIPO[tipo]][indice])
     
-    if tipo == 'circulo':
-        cx, cy, radio, color, grosor = estado['circulos_almacenados'][indice]
-        estado['circulos_almacenados'][indice] = (cx, cy, radio * factor, color, grosor)
-    
-    elif tipo == 'rectangulo':
-        x0, y0, x1, y1, color, grosor = estado['rectangulos_almacenados'][indice]
-        centro_x = (x0 + x1) / 2
-        centro_y = (y0 + y1) / 2
-        
-        T1 = crear_matriz_traslacion(-centro_x, -centro_y)
-        S = crear_matriz_escala(factor, factor)
-        T2 = crear_matriz_traslacion(centro_x, centro_y)
-        M = T2.dot(S).dot(T1)
-        
-        x0n, y0n = aplicar_transformacion((x0, y0), M)
-        x1n, y1n = aplicar_transformacion((x1, y1), M)
-        
-        estado['rectangulos_almacenados'][indice] = (x0n, y0n, x1n, y1n, color, grosor)
-    
-    elif tipo == 'linea':
-        x0, y0, x1, y1, color, grosor = estado['lineas_almacenadas'][indice]
-        centro_x = (x0 + x1) / 2
-        centro_y = (y0 + y1) / 2
-        
-        T1 = crear_matriz_traslacion(-centro_x, -centro_y)
-        S = crear_matriz_escala(factor, factor)
-        T2 = crear_matriz_traslacion(centro_x, centro_y)
-        M = T2.dot(S).dot(T1)
-        
-        x0n, y0n = aplicar_transformacion((x0, y0), M)
-        x1n, y1n = aplicar_transformacion((x1, y1), M)
-        
-        estado['lineas_almacenadas'][indice] = (x0n, y0n, x1n, y1n, color, grosor)
-    
-    elif tipo == 'curva':
-        puntos_control, color, grosor = estado['curvas_almacenadas'][indice]
-        centro_x = sum(p[0] for p in puntos_control) / len(puntos_control)
-        centro_y = sum(p[1] for p in puntos_control) / len(puntos_control)
-        
-        T1 = crear_matriz_traslacion(-centro_x, -centro_y)
-        S = crear_matriz_escala(factor, factor)
-        T2 = crear_matriz_traslacion(centro_x, centro_y)
-        M = T2.dot(S).dot(T1)
-        
-        nuevos_puntos = [aplicar_transformacion(p, M) for p in puntos_control]
-        estado['curvas_almacenadas'][indice] = (nuevos_puntos, color, grosor)
+    T1 = crear_matriz_traslacion(-centro_x, -centro_y)
+    S = crear_matriz_escala(factor, factor)
+    T2 = crear_matriz_traslacion(centro_x, centro_y)
+    transformar_figura(estado, tipo, indice, T2.dot(S).dot(T1))
     
     return estado
 
@@ -468,63 +1050,52 @@ def aplicar_recorte(estado):
         return estado
     x0, y0, x1, y1 = estado['area_recorte']
 
-    estado['pixeles_almacenados'] = [
-        (x, y, color, tamanho) for (x, y, color, tamanho) in estado['pixeles_almacenados']
-        if x0 <= x <= x1 and y0 <= y <= y1
-    ]
-
-    estado['lineas_almacenadas'] = [
-        (nx0, ny0, nx1, ny1, color, grosor)
-        for (x0_l, y0_l, x1_l, y1_l, color, grosor) in estado['lineas_almacenadas']
-        if (resultado := recortar_linea_cohen_sutherland(x0_l, y0_l, x1_l, y1_l, estado['area_recorte']))
-        for (nx0, ny0, nx1, ny1) in [resultado]
-    ]
-
-    nuevas_curvas = []
-    for puntos_control, color, grosor in estado['curvas_almacenadas']:
-        curva = calcular_curva_lagrange(puntos_control) if len(puntos_control) == 3 else puntos_control
-        curva_recortada = [
-            (x, y) for (x, y) in curva
-            if x0 <= x <= x1 and y0 <= y <= y1
-        ]
-        if curva_recortada:
-            nuevas_curvas.append((puntos_control, color, grosor))
-    estado['curvas_almacenadas'] = nuevas_curvas
-
-    nuevas_circulos = []
-    for datos in estado['circulos_almacenados']:
-        if len(datos) == 5:
-            cx, cy, radio, color, grosor = datos
-            puntos = []
-            for i in range(100):
-                angulo = 2 * math.pi * i / 100
-                x = cx + radio * math.cos(angulo)
-                y = cy + radio * math.sin(angulo)
-                if x0 <= x <= x1 and y0 <= y <= y1:
-                    puntos.append((x, y))
-            if puntos:
-                nuevas_circulos.append((puntos, color, grosor))
-        elif len(datos) == 3:
-            puntos, color, grosor = datos
-            puntos_recortados = [(x, y) for (x, y) in puntos if x0 <= x <= x1 and y0 <= y <= y1]
-            if puntos_recortados:
-                nuevas_circulos.append((puntos_recortados, color, grosor))
-    estado['circulos_almacenados'] = nuevas_circulos
+    filtrar_trazos(estado, lambda p: (x0 <= p[:, 0]) & (p[:, 0] <= x1) & (y0 <= p[:, 1]) & (p[:, 1] <= y1))
 
-    nuevas_rectangulos = []
-    for x0_r, y0_r, x1_r, y1_r, color, grosor in estado['rectangulos_almacenados']:
-        lados = [
+    # Las líneas y los lados de los rectángulos se recortan en un solo lote
+    segmentos = []
+    destinos = []
+    for i, (x0_l, y0_l, x1_l, y1_l, color, grosor) in estado['lineas_almacenadas'].items():
+        segmentos.append((x0_l, y0_l, x1_l, y1_l))
+        destinos.append((i, color, grosor))
+    for i, (x0_r, y0_r, x1_r, y1_r, color, grosor) in estado['rectangulos_almacenados'].items():
+        segmentos.extend([
             (x0_r, y0_r, x1_r, y0_r),
             (x1_r, y0_r, x1_r, y1_r),
             (x1_r, y1_r, x0_r, y1_r),
             (x0_r, y1_r, x0_r, y0_r),
-        ]
-        for lx0, ly0, lx1, ly1 in lados:
-            rec = recortar_linea_cohen_sutherland(lx0, ly0, lx1, ly1, estado['area_recorte'])
-            if rec:
-                nuevas_rectangulos.append((*rec, color, grosor))
-    estado['rectangulos_almacenados'] = []
-    estado['lineas_almacenadas'].extend(nuevas_rectangulos)
+        ])
+        destinos.extend([(None, color, grosor)] * 4)
+    recortados, aceptados = recortar_segmentos(segmentos, estado['area_recorte'])
+
+    # Los rectángulos se convierten en las líneas de sus lados recortados
+    for i in list(estado['rectangulos_almacenados']):
+        eliminar_figura(estado, 'rectangulo', i)
+    for (i, color, grosor), segmento, aceptado in zip(destinos, recortados.tolist(), aceptados.tolist()):
+        if i is None:
+            if aceptado:
+                agregar_figura(estado, 'linea', (*segmento, color, grosor))
+        elif aceptado:
+            reemplazar_figura(estado, 'linea', i, (*segmento, color, grosor))
+        else:
+            eliminar_figura(estado, 'linea', i)
+
+    for i, (puntos_control, color, grosor) in list(estado['curvas_almacenadas'].items()):
+        if not puntos_dentro(puntos_de_figura('curva', (puntos_control, color, grosor)), estado['area_recorte']).any():
+            eliminar_figura(estado, 'curva', i)
+
+    for i, datos in list(estado['circulos_almacenados'].items()):
+        if len(datos) == 5:
+            cx, cy, radio, color, grosor = datos
+            puntos = puntos_de_figura('circulo', datos)
+        else:
+            puntos, color, grosor = datos
+        mascara = puntos_dentro(puntos, estado['area_recorte'])
+        if mascara.any():
+            puntos = [tuple(p) for p in np.asarray(puntos, dtype=np.float64).reshape(-1, 2)[mascara].tolist()]
+            reemplazar_figura(estado, 'circulo', i, (puntos, color, grosor))
+        else:
+            eliminar_figura(estado, 'circulo', i)
 
     estado['area_recorte'] = None
     return estado
@@ -682,7 +1253,7 @@ def dibujar_icono(herramienta, x):
         glEnd()
 
 # Dibuja la barra de herramientas con los iconos de las herramientas
-def dibujar_barra_herramientas(estado):
+def pintar_barra_herramientas(estado):
     glColor3f(0.9, 0.9, 0.9)
     glBegin(GL_QUADS)
     glVertex2f(0, 0)
@@ -732,114 +1303,408 @@ def dibujar_barra_herramientas(estado):
         glEnd()
 
     # Texto de información
-    glColor3f(0.2, 0.2, 0.2)
-    glRasterPos2f(colores_x + len(colores) * 35 + 20, 25)
-    texto = f"Grosor: {estado['grosor_linea']} (T/Shift+G para cambiar)"
-    for char in texto:
-        pygame.font.init()
-        fuente = pygame.font.SysFont('Arial', 12)
-        superficie_texto = fuente.render(char, True, (50, 50, 50))
-        datos_textura = pygame.image.tostring(superficie_texto, "RGBA", True)
-        glDrawPixels(superficie_texto.get_width(), superficie_texto.get_height(),
-                    GL_RGBA, GL_UNSIGNED_BYTE, datos_textura)
-        glRasterPos2f(glGetDoublev(GL_CURRENT_RASTER_POSITION)[0] + superficie_texto.get_width(), 25)
+    texto_x = colores_x + len(colores) * 35 + 20
+    capa = estado['capas'][estado['capa_activa']]
+    dibujar_texto(estado, f"Grosor: {estado['grosor_linea']} (T/Shift+G para cambiar)  "
+                          f"Capa {estado['capa_activa'] + 1}/{len(estado['capas'])} "
+                          f"{round(capa['opacidad'] * 100)}%{'' if capa['visible'] else ' oculta'}", texto_x, 25)
 
     if estado['figura_seleccionada']:
-        glColor3f(0.2, 0.2, 0.2)
-        glRasterPos2f(colores_x + len(colores) * 35 + 20, 10)
-        texto = "R: Rotar | S: Escalar | Shift: Invertir"
-        for char in texto:
-            fuente = pygame.font.SysFont('Arial', 12)
-            superficie_texto = fuente.render(char, True, (50, 50, 50))
-            datos_textura = pygame.image.tostring(superficie_texto, "RGBA", True)
-            glDrawPixels(superficie_texto.get_width(), superficie_texto.get_height(),
-                        GL_RGBA, GL_UNSIGNED_BYTE, datos_textura)
-            glRasterPos2f(glGetDoublev(GL_CURRENT_RASTER_POSITION)[0] + superficie_texto.get_width(), 10)
+        dibujar_texto(estado, "R: Rotar | S: Escalar | Shift: Invertir", texto_x, 10)
+
+# La barra solo cambia con la herramienta, el color, el grosor, la selección o
+# la capa activa: se dibuja una vez, se copia a una textura y después se pega
+# con un quad
+def dibujar_barra_herramientas(estado):
+    barra = estado['barra']
+    capa = estado['capas'][estado['capa_activa']]
+    clave = (estado['herramienta_actual'], estado['color_actual'], estado['grosor_linea'],
+             bool(estado['figura_seleccionada']), estado['ancho'],
+             estado['capa_activa'], len(estado['capas']), capa['visible'], capa['opacidad'])
+    if barra['clave'] == clave:
+        glEnable(GL_TEXTURE_2D)
+        glBindTexture(GL_TEXTURE_2D, barra['textura'])
+        glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_REPLACE)
+        glBegin(GL_QUADS)
+        glTexCoord2f(0, 1); glVertex2f(0, 0)
+        glTexCoord2f(1, 1); glVertex2f(estado['ancho'], 0)
+        glTexCoord2f(1, 0); glVertex2f(estado['ancho'], ALTO_BARRA)
+        glTexCoord2f(0, 0); glVertex2f(0, ALTO_BARRA)
+        glEnd()
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glDisable(GL_TEXTURE_2D)
+        return
+
+    pintar_barra_herramientas(estado)
+    if barra['textura'] is None:
+        barra['textura'] = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, barra['textura'])
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+    glBindTexture(GL_TEXTURE_2D, barra['textura'])
+    glCopyTexImage2D(GL_TEXTURE_2D, 0, GL_RGB, 0, estado['alto'] - ALTO_BARRA, estado['ancho'], ALTO_BARRA, 0)
+    glBindTexture(GL_TEXTURE_2D, 0)
+    barra['clave'] = clave
+
+# Fuentes de pygame ya creadas, compartidas por todo el programa
+fuentes = {}
+
+def obtener_fuente(nombre='Arial', tamanho=12):
+    if (nombre, tamanho) not in fuentes:
+        if not pygame.font.get_init():
+            pygame.font.init()
+        fuentes[(nombre, tamanho)] = pygame.font.SysFont(nombre, tamanho)
+    return fuentes[(nombre, tamanho)]
+
+# Atlas de glifos: todos los caracteres en una fila de una sola textura RGBA
+# Guarda por carácter su columna inicial y su ancho en pixeles
+def crear_atlas_glifos(caracteres, color=(50, 50, 50)):
+    fuente = obtener_fuente()
+    imagenes = []
+    for char in caracteres:
+        superficie = fuente.render(char, True, color)
+        w, h = superficie.get_size()
+        datos = np.frombuffer(pygame.image.tostring(superficie, "RGBA", True), dtype=np.uint8)
+        imagenes.append(datos.reshape(h, w, 4))
+    alto = max(imagen.shape[0] for imagen in imagenes)
+    ancho = sum(imagen.shape[1] for imagen in imagenes)
+    pixeles = np.zeros((alto, ancho, 4), dtype=np.uint8)
+    glifos = {}
+    x = 0
+    for char, imagen in zip(caracteres, imagenes):
+        h, w = imagen.shape[:2]
+        pixeles[:h, x:x + w] = imagen  # Fila 0 abajo, como en OpenGL
+        glifos[char] = (x, w, h)
+        x += w
+
+    textura = glGenTextures(1)
+    glBindTexture(GL_TEXTURE_2D, textura)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+    glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, ancho, alto, 0, GL_RGBA, GL_UNSIGNED_BYTE, pixeles)
+    glBindTexture(GL_TEXTURE_2D, 0)
+    return {'textura': textura, 'glifos': glifos, 'ancho': ancho, 'alto': alto}
+
+# Dibuja un texto con una sola llamada: un quad por carácter tomado del atlas
+# (x, y) es la esquina inferior izquierda del texto
+def dibujar_texto(estado, texto, x, y):
+    atlas = estado['atlas_glifos']
+    if atlas is None or any(char not in atlas['glifos'] for char in texto):
+        caracteres = ''.join(chr(c) for c in range(32, 127))
+        if atlas is not None:
+            caracteres += ''.join(sorted(set(atlas['glifos']) - set(caracteres)))
+            glDeleteTextures([atlas['textura']])
+        caracteres += ''.join(sorted(set(texto) - set(caracteres)))
+        atlas = estado['atlas_glifos'] = crear_atlas_glifos(caracteres)
+
+    vertices = []
+    coordenadas = []
+    for char in texto:
+        columna, w, h = atlas['glifos'][char]
+        u0, u1 = columna / atlas['ancho'], (columna + w) / atlas['ancho']
+        v1 = h / atlas['alto']
+        vertices += [(x, y), (x + w, y), (x + w, y - h), (x, y - h)]
+        coordenadas += [(u0, 0), (u1, 0), (u1, v1), (u0, v1)]
+        x += w
+
+    glEnable(GL_TEXTURE_2D)
+    glBindTexture(GL_TEXTURE_2D, atlas['textura'])
+    glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_REPLACE)
+    glEnable(GL_BLEND)
+    glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+    glVertexPointer(2, GL_FLOAT, 0, np.array(vertices, dtype=np.float32))
+    glTexCoordPointer(2, GL_FLOAT, 0, np.array(coordenadas, dtype=np.float32))
+    glDrawArrays(GL_QUADS, 0, len(vertices))
+    glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+    glDisableClientState(GL_VERTEX_ARRAY)
+    glDisable(GL_BLEND)
+    glBindTexture(GL_TEXTURE_2D, 0)
+    glDisable(GL_TEXTURE_2D)
+
+# Crea el lienzo persistente: una textura del tamaño de la ventana enlazada a
+# un framebuffer object donde se acumula la geometría confirmada
+# Devuelve None si el controlador no soporta FBO; entonces se redibuja todo
+def crear_lienzo(ancho, alto):
+    try:
+        textura = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, textura)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA8, ancho, alto, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+        fbo = glGenFramebuffers(1)
+        glBindFramebuffer(GL_FRAMEBUFFER, fbo)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, textura, 0)
+        completo = glCheckFramebufferStatus(GL_FRAMEBUFFER) == GL_FRAMEBUFFER_COMPLETE
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+    except Exception as e:
+        print(f"Lienzo persistente no disponible: {e}")
+        return None
+    if not completo:
+        return None
+    return {
+        'fbo': fbo,
+        'textura': textura,
+        'clave': None,     # Área de recorte con la que se pintó
+        'dibujados': None,  # Hasta qué id (y muestras del trazo abierto) está dibujado el lienzo
+        'danos': [],  # Cajas con figuras cambiadas o borradas que hay que repintar
+    }
+
+# Marca una caja del lienzo para repintarla en el próximo cuadro; se llama cuando
+# una figura ya dibujada cambia o se elimina (borrar, rotar, escalar, recortar)
+def danar_lienzo(estado, caja):
+    if estado['lienzo'] and caja is not None:
+        estado['lienzo']['danos'].append(caja)
+    return estado
+
+# Repinta solo una caja del lienzo: el scissor limita el borrado y las figuras que el árbol de dibujo encuentra en la caja
+def repintar_region(estado, caja):
+    x0 = max(0, math.floor(caja[0]))
+    y0 = max(0, math.floor(caja[1]))
+    x1 = min(estado['ancho'], math.ceil(caja[2]) + 1)
+    y1 = min(estado['alto'], math.ceil(caja[3]) + 1)
+    if x0 >= x1 or y0 >= y1:
+        return
+    glEnable(GL_SCISSOR_TEST)
+    glScissor(x0, estado['alto'] - y1, x1 - x0, y1 - y0)  # Filas contadas desde abajo
+    glClearColor(0, 0, 0, 0)
+    glClear(GL_COLOR_BUFFER_BIT)
+    dibujar_almacenados(estado, claves=consultar_arbol(estado['arbol_dibujo'], x0, y0, x1, y1))
+    glDisable(GL_SCISSOR_TEST)
+
+# Figuras (id, figura) de un almacén con id >= id_minimo; como los ids crecen
+# con el orden de inserción, basta recorrer el diccionario desde el final
+def figuras_desde(almacen, id_minimo):
+    nuevas = []
+    for id_figura in reversed(almacen):
+        if id_figura < id_minimo:
+            break
+        nuevas.append((id_figura, almacen[id_figura]))
+    return nuevas[::-1]
+
+# Puntos de un círculo o una curva antes de recortar
+def puntos_de_figura(tipo, figura):
+    if tipo == 'curva':
+        puntos = figura[0]
+        return calcular_curva_lagrange(puntos) if len(puntos) == 3 else puntos
+    return puntos_circulo(*figura[:3])
+
+# Puntos visibles (float32, listos para glVertexPointer) de un círculo o una
+# curva dentro del área de recorte. Se guardan por figura; la entrada se borra
+# cuando la figura cambia (desindexar_figura) y todo el caché cuando cambia el
+# rectángulo de recorte
+def puntos_recortados(estado, tipo, id_figura, figura):
+    cache = estado['cache_recorte']
+    if cache['area'] != estado['area_recorte']:
+        cache['area'] = estado['area_recorte']
+        cache['figuras'] = {}
+    clave = (tipo, id_figura)
+    if clave not in cache['figuras']:
+        puntos = np.asarray(puntos_de_figura(tipo, figura), dtype=np.float64).reshape(-1, 2)
+        visibles = puntos[puntos_dentro(puntos, estado['area_recorte'])]
+        cache['figuras'][clave] = visibles.astype(np.float32)
+    return cache['figuras'][clave]
+
+# Dibuja las figuras almacenadas; con 'desde' solo las añadidas después de
+# ese punto: {'id': primer id nuevo, 'trazo': (id del trazo abierto, muestras)}
+# Con 'claves' solo esas figuras (tipo, id), en el mismo orden que el resto
+def dibujar_almacenados(estado, desde=None, claves=None):
+    if desde is None:
+        desde = {'id': 0, 'trazo': (None, 0)}
+    if claves is None:
+        nuevas = {clave: figuras_desde(estado[clave], desde['id']) for clave in ALMACENES}
+    else:
+        nuevas = {clave: [] for clave in ALMACENES}
+        for tipo, id_figura in sorted(claves):
+            almacen = ALMACEN_DE_TIPO[tipo]
+            nuevas[almacen].append((id_figura, estado[almacen][id_figura]))
+
+    # Dibuja los trazos del lápiz si es que existen: los nuevos completos y, del
+    # que seguía abierto, solo las muestras añadidas después
+    pendientes = [(trazo, 0) for _, trazo in nuevas['trazos_almacenados']]
+    id_abierto, muestras = desde['trazo']
+    abierto = estado['trazos_almacenados'].get(id_abierto)
+    if abierto is not None and id_abierto < desde['id'] and abierto['total'] > muestras:
+        pendientes.insert(0, (abierto, muestras))
+    dibujar_trazos(pendientes)
 
-# Vuelve a dibujar todo
-def redibujar_todo(estado):
-    glClearColor(1, 1, 1, 1)
-    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-    
-    dibujar_cuadricula(estado)
-    
-    # Dibuja los pixeles almacenados si es que existen
-    for x, y, color, tamanho in estado['pixeles_almacenados']:
-        dibujar_pixel(estado, x, y, almacenar=False, color=color, tamanho=tamanho)
-    
     # Dibuja las líneas almacenadas si es que existen
-    for i, (x0, y0, x1, y1, color, grosor) in enumerate(estado['lineas_almacenadas']):
-        glColor3f(*color)
-        glLineWidth(grosor)
-        dibujar_linea_bresenham(estado, x0, y0, x1, y1, almacenar=False)
-        
-        if estado['figura_seleccionada'] and estado['figura_seleccionada'][0] == 'linea' and estado['figura_seleccionada'][1] == i:
-            glColor3f(0, 1, 1)
-            glLineWidth(grosor + 2)
-            dibujar_linea_bresenham(estado, x0, y0, x1, y1, almacenar=False)
-    
+    for _, (x0, y0, x1, y1, color, grosor) in nuevas['lineas_almacenadas']:
+        dibujar_linea_bresenham(estado, x0, y0, x1, y1, almacenar=False, color=color, grosor=grosor)
+
     # Dibuja las curvas almacenadas si es que existen
-    for i, (pts, color, grosor) in enumerate(estado['curvas_almacenadas']):
-        glColor3f(*color)
-        glLineWidth(grosor)
-        glBegin(GL_LINE_STRIP)
-        curva = calcular_curva_lagrange(pts) if len(pts) == 3 else pts
-        for x, y in curva:
-            if not estado['area_recorte'] or (
-                estado['area_recorte'][0] <= x <= estado['area_recorte'][2] and
-                estado['area_recorte'][1] <= y <= estado['area_recorte'][3]
-            ):
-                glVertex2f(x, y)
-        glEnd()
-        glLineWidth(1)
+    sin_recortar = []
+    for id_curva, (pts, color, grosor) in nuevas['curvas_almacenadas']:
+        if estado['area_recorte'] and RECORTAR_AL_GUARDAR:
+            dibujar_arreglo_linea(puntos_recortados(estado, 'curva', id_curva, (pts, color, grosor)), color, grosor)
+        elif estado['area_recorte']:
+            curva = np.asarray(puntos_de_figura('curva', (pts, color, grosor)), dtype=np.float64).reshape(-1, 2)
+            dibujar_arreglo_linea(curva[puntos_dentro(curva, estado['area_recorte'])].astype(np.float32), color, grosor)
+        else:
+            sin_recortar.append((pts, color, grosor))
+    for curva, color, grosor in aplanar_curvas(sin_recortar):
+        dibujar_arreglo_linea(curva, color, grosor)
 
-    # Dibuja los círculos almacenados si es que existen
-    for i, datos in enumerate(estado['circulos_almacenados']):
-        if len(datos) == 5:
-            cx, cy, radio, color, grosor = datos
-            glColor3f(*color)
-            glPointSize(grosor)
-            glBegin(GL_POINTS)
-            for j in range(100):
-                angulo = 2 * math.pi * j / 100
-                x = cx + radio * math.cos(angulo)
-                y = cy + radio * math.sin(angulo)
-                if not estado['area_recorte'] or (
-                    estado['area_recorte'][0] <= x <= estado['area_recorte'][2] and
-                    estado['area_recorte'][1] <= y <= estado['area_recorte'][3]
-                ):
-                    glVertex2f(x, y)
-            glEnd()
-            glPointSize(1)
-        elif len(datos) == 3:
-            puntos, color, grosor = datos
-            glColor3f(*color)
-            glPointSize(grosor)
-            glBegin(GL_POINTS)
-            for x, y in puntos:
-                glVertex2f(x, y)
-            glEnd()
-            glPointSize(1)
+    # Dibuja los círculos almacenados si es que existen, por tramos del mismo
+    # estilo; con el área de recorte activa se dibujan solo sus puntos visibles
+    circulos = []
+    for id_circulo, datos in nuevas['circulos_almacenados']:
+        if len(datos) == 5 and estado['area_recorte'] and RECORTAR_AL_GUARDAR:
+            circulos.append((puntos_recortados(estado, 'circulo', id_circulo, datos), datos[3], datos[4]))
+        elif len(datos) == 5 and estado['area_recorte']:
+            visibles = puntos_de_figura('circulo', datos)
+            circulos.append((visibles[puntos_dentro(visibles, estado['area_recorte'])], datos[3], datos[4]))
+        else:
+            circulos.append(datos)
+    dibujar_circulos(circulos)
 
     # Dibuja los rectángulos almacenados si es que existen
-    for i, (x0, y0, x1, y1, color, grosor) in enumerate(estado['rectangulos_almacenados']):
+    for _, (x0, y0, x1, y1, color, grosor) in nuevas['rectangulos_almacenados']:
         lados = [
             (x0, y0, x1, y0),
             (x1, y0, x1, y1),
             (x1, y1, x0, y1),
             (x0, y1, x0, y0),
         ]
-        glColor3f(*color)
-        glLineWidth(grosor)
         for lx0, ly0, lx1, ly1 in lados:
             if estado['area_recorte']:
                 rec = recortar_linea_cohen_sutherland(lx0, ly0, lx1, ly1, estado['area_recorte'])
                 if rec:
-                    dibujar_linea_bresenham(estado, *rec, almacenar=False)
+                    dibujar_linea_bresenham(estado, *rec, almacenar=False, color=color, grosor=grosor)
             else:
-                dibujar_linea_bresenham(estado, lx0, ly0, lx1, ly1, almacenar=False)
+                dibujar_linea_bresenham(estado, lx0, ly0, lx1, ly1, almacenar=False, color=color, grosor=grosor)
     glLineWidth(1)
 
+# Caja de las muestras de un trazo desde la muestra 'desde' (incluida la
+# anterior, que une el tramo nuevo con lo ya dibujado)
+def caja_muestras(trazo, desde):
+    puntos = trazo['puntos'][max(desde - 1, 0):trazo['total']]
+    margen = trazo['tamanho'] + 2
+    return (int(puntos[:, 0].min()) - margen, int(puntos[:, 1].min()) - margen,
+            int(puntos[:, 0].max()) + margen, int(puntos[:, 1].max()) + margen)
+
+# Cajas (tipo, id, caja) de lo que falta dibujar en el lienzo: las figuras
+# añadidas y las muestras nuevas del trazo que seguía abierto
+def cajas_pendientes(estado, desde):
+    cajas = estado['arbol_dibujo']['cajas']
+    pendientes = []
+    for almacen, tipo in zip(ALMACENES, ALMACEN_DE_TIPO):
+        pendientes += [(tipo, id_figura, cajas[(tipo, id_figura)])
+                       for id_figura, _ in figuras_desde(estado[almacen], desde['id'])]
+    id_abierto, muestras = desde['trazo']
+    abierto = estado['trazos_almacenados'].get(id_abierto)
+    if abierto is not None and id_abierto < desde['id'] and abierto['total'] > muestras:
+        pendientes.append(('trazo', id_abierto, caja_muestras(abierto, muestras)))
+    return pendientes
+
+# Una figura pendiente solo puede dibujarse encima del lienzo si ninguna de las
+# ya dibujadas que toca va después en el orden de dibujo (almacén según
+# ORDEN_DIBUJO y luego id); si no, hay que repintar su caja
+def tapa_dibujadas(estado, tipo, id_figura, caja, id_dibujados):
+    orden = (ORDEN_DIBUJO[tipo], id_figura)
+    for otro_tipo, otro_id in consultar_arbol(estado['arbol_dibujo'], *caja):
+        if otro_id < id_dibujados and (ORDEN_DIBUJO[otro_tipo], otro_id) > orden:
+            return True
+    return False
+
+# Lleva el lienzo al día: si se invalidó o el daño es grande se repinta entero;
+# si hay daño se repinta solo la caja que lo contiene junto con las figuras
+# nuevas, en el mismo orden que un repintado completo; si no, solo se dibujan
+# encima las figuras añadidas desde el último cuadro. Una figura nueva que
+# tendría que quedar debajo de otra ya dibujada cuenta como daño
+def actualizar_lienzo(estado):
+    lienzo = estado['lienzo']
+    clave = estado['area_recorte']
+    danos = lienzo['danos']
+    if lienzo['clave'] != clave:
+        if lienzo['clave'] and estado['area_recorte']:
+            # Mover el área de recorte solo cambia lo que estaba en la vieja o la nueva
+            x0, y0, x1, y1 = unir_cajas(lienzo['clave'], estado['area_recorte'])
+            danos.append((x0 - MARGEN_RECORTE, y0 - MARGEN_RECORTE, x1 + MARGEN_RECORTE, y1 + MARGEN_RECORTE))
+        else:
+            lienzo['dibujados'] = None
+    danada = None
+    if lienzo['dibujados'] is not None:
+        pendientes = cajas_pendientes(estado, lienzo['dibujados'])
+        if danos or any(tapa_dibujadas(estado, tipo, id_figura, caja, lienzo['dibujados']['id'])
+                        for tipo, id_figura, caja in pendientes):
+            danos += [caja for _, _, caja in pendientes]
+            danada = danos[0]
+            for caja in danos[1:]:
+                danada = unir_cajas(danada, caja)
+            if area_caja(danada) > FRACCION_DANO_MAXIMA * estado['ancho'] * estado['alto']:
+                lienzo['dibujados'] = None
+
+    glBindFramebuffer(GL_FRAMEBUFFER, lienzo['fbo'])
+    if lienzo['dibujados'] is None:
+        glClearColor(0, 0, 0, 0)
+        glClear(GL_COLOR_BUFFER_BIT)
+        dibujar_almacenados(estado)
+    elif danada is not None:
+        repintar_region(estado, danada)
+    else:
+        dibujar_almacenados(estado, lienzo['dibujados'])
+    glBindFramebuffer(GL_FRAMEBUFFER, 0)
+    lienzo['clave'] = clave
+    lienzo['danos'] = []
+    abierto = estado['trazos_almacenados'].get(estado['trazo_actual'])
+    lienzo['dibujados'] = {
+        'id': estado['siguiente_id'],
+        'trazo': (estado['trazo_actual'], abierto['total'] if abierto else 0),
+    }
+    return estado
+
+# Mezcla el lienzo de una capa sobre la ventana con un solo quad texturizado
+# La proyección tiene el eje y hacia abajo, por eso la coordenada t se invierte
+def componer_lienzo(estado, opacidad=1.0):
+    glEnable(GL_TEXTURE_2D)
+    glBindTexture(GL_TEXTURE_2D, estado['lienzo']['textura'])
+    glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_MODULATE)
+    glEnable(GL_BLEND)
+    glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+    glColor4f(1, 1, 1, opacidad)
+    glBegin(GL_QUADS)
+    glTexCoord2f(0, 1); glVertex2f(0, 0)
+    glTexCoord2f(1, 1); glVertex2f(estado['ancho'], 0)
+    glTexCoord2f(1, 0); glVertex2f(estado['ancho'], estado['alto'])
+    glTexCoord2f(0, 0); glVertex2f(0, estado['alto'])
+    glEnd()
+    glDisable(GL_BLEND)
+    glBindTexture(GL_TEXTURE_2D, 0)
+    glDisable(GL_TEXTURE_2D)
+
+# Dibuja la cuadrícula y encima las capas visibles de abajo hacia arriba
+# Cada capa solo se rasteriza de nuevo si cambió algo en ella
+def dibujar_capas(estado):
+    dibujar_cuadricula(estado)
+    for indice, capa in enumerate(estado['capas']):
+        if not capa['visible']:
+            continue
+        vista = vista_capa(estado, indice)
+        if capa['lienzo']:
+            actualizar_lienzo(vista)
+            componer_lienzo(vista, capa['opacidad'])
+        else:
+            dibujar_almacenados(vista)
+
+# Vuelve a dibujar todo
+# La geometría confirmada sale de los lienzos de las capas; encima se dibujan solo
+# los elementos transitorios: selección, área de recorte y barra de herramientas
+def redibujar_todo(estado):
+    glClearColor(1, 1, 1, 1)
+    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+
+    dibujar_capas(estado)
+
+    # Resalta la línea seleccionada
+    if estado['figura_seleccionada'] and estado['figura_seleccionada'][0] == 'linea':
+        x0, y0, x1, y1, color, grosor = estado['lineas_almacenadas'][estado['figura_seleccionada'][1]]
+        dibujar_linea_bresenham(estado, x0, y0, x1, y1, almacenar=False, color=(0, 1, 1), grosor=grosor + 2)
+
     # Dibuja el área de recorte con el raton
     if estado['area_recorte']:
         x0, y0, x1, y1 = estado['area_recorte']
@@ -893,28 +1758,88 @@ def redibujar_todo(estado):
     pygame.display.flip()
     return estado
 
+# Matrices de Bernstein cuadráticas ya calculadas, una por cantidad de segmentos
+# Cada fila tiene los pesos (1-t)^2, 2(1-t)t, t^2 de un valor de t
+bases_bernstein = {}
+
+def base_bernstein(segmentos):
+    if segmentos not in bases_bernstein:
+        t = np.linspace(0.0, 1.0, segmentos + 1)[:, None]
+        bases_bernstein[segmentos] = np.hstack([(1 - t) ** 2, 2 * (1 - t) * t, t ** 2])
+    return bases_bernstein[segmentos]
+
+# Segmentos que necesita una curva: la distancia entre la curva y su cuerda en
+# un tramo de largo 1/n en t es a lo sumo |P0 - 2P1 + P2| / (4 n^2)
+def segmentos_curva(puntos_control):
+    (x0, y0), (x1, y1), (x2, y2) = puntos_control
+    desvio = math.hypot(x0 - 2 * x1 + x2, y0 - 2 * y1 + y2)
+    return max(SEGMENTOS_CURVA_MINIMOS, math.ceil(math.sqrt(desvio / (4 * TOLERANCIA_CURVA))))
+
+# Segmentos con los que se guarda una curva: los de segmentos_curva y los que
+# hacen falta para no pasar de LARGO_MAXIMO_TRAMO_CURVA. La velocidad de la
+# curva nunca supera 2 * max(|P1 - P0|, |P2 - P1|), así que un tramo de largo
+# 1/n en t mide a lo sumo eso dividido entre n
+def segmentos_curva_guardada(puntos_control):
+    (x0, y0), (x1, y1), (x2, y2) = puntos_control
+    velocidad = 2 * max(math.hypot(x1 - x0, y1 - y0), math.hypot(x2 - x1, y2 - y1))
+    return max(segmentos_curva(puntos_control), math.ceil(velocidad / LARGO_MAXIMO_TRAMO_CURVA))
+
+# Evalúa muchas curvas (M, 3, 2) con la misma cantidad de segmentos en un solo
+# producto de matrices; devuelve (M, segmentos + 1, 2)
+def evaluar_curvas(controles, segmentos):
+    controles = np.asarray(controles, dtype=np.float64).reshape(-1, 3, 2)
+    return base_bernstein(segmentos) @ controles
+
+# Aplana curvas (puntos, color, grosor) para dibujarlas: las guardadas con sus
+# 3 puntos de control se evalúan juntas, agrupadas por cantidad de segmentos
+# Devuelve (puntos float32, color, grosor) en el mismo orden
+def aplanar_curvas(curvas):
+    aplanadas = [None] * len(curvas)
+    grupos = {}
+    for k, (puntos, color, grosor) in enumerate(curvas):
+        if len(puntos) == 3:
+            grupos.setdefault(segmentos_curva(puntos), []).append(k)
+        else:
+            aplanadas[k] = (np.asarray(puntos, dtype=np.float32).reshape(-1, 2), color, grosor)
+    for segmentos, indices in grupos.items():
+        evaluadas = evaluar_curvas([curvas[k][0] for k in indices], segmentos).astype(np.float32)
+        for k, puntos in zip(indices, evaluadas):
+            aplanadas[k] = (puntos, curvas[k][1], curvas[k][2])
+    return aplanadas
+
 # Algoritmo para dibujar una curva
-def calcular_curva_lagrange(puntos_control, segmentos=100):
+# Sin 'segmentos' se usan los de segmentos_curva_guardada: los puntos que
+# devuelve se guardan y se prueban uno por uno
+def calcular_curva_lagrange(puntos_control, segmentos=None):
     if len(puntos_control) != 3:
         return []
-    p0, p1, p2 = puntos_control
-    curva = []
-    for i in range(segmentos + 1):
-        t = i / segmentos
-        x = (1 - t) ** 2 * p0[0] + 2 * (1 - t) * t * p1[0] + t ** 2 * p2[0]
-        y = (1 - t) ** 2 * p0[1] + 2 * (1 - t) * t * p1[1] + t ** 2 * p2[1]
-        curva.append((x, y))
-    return curva
+    if segmentos is None:
+        segmentos = segmentos_curva_guardada(puntos_control)
+    return [tuple(p) for p in evaluar_curvas(puntos_control, segmentos)[0].tolist()]
 
 # Funcion principal
 def main():
     estado = inicializar_pygame(1000, 600)
-    estado = redibujar_todo(estado)
+    redibujar = True  # Algún evento cambió lo que se ve y falta mostrarlo
+    pendiente_desde = None  # Llegada del primer evento aún no mostrado
+    ultimo_cuadro = 0.0
+    latencias = []
+    eventos_por_cuadro = []
+    eventos_sin_mostrar = 0
     ejecutando = True
     while ejecutando:
-        for evento in pygame.event.get():
+        # Sin nada pendiente se bloquea hasta el próximo evento; después se
+        # vacía la cola entera antes de dibujar
+        eventos = pygame.event.get()
+        if not eventos and not redibujar:
+            eventos = [pygame.event.wait()] + pygame.event.get()
+        llegada = time.perf_counter()
+        for evento in eventos:
             if evento.type == pygame.QUIT:
                 ejecutando = False
+
+            elif evento.type == pygame.VIDEOEXPOSE:
+                redibujar = True
             
             elif evento.type == pygame.MOUSEBUTTONDOWN:
                 x, y = evento.pos
@@ -927,7 +1852,7 @@ def main():
                             x0, y0 = estado['puntos'][0]
                             estado = dibujar_linea_bresenham(estado, x0, y0, x, y)
                             estado['puntos'] = []
-                            estado = redibujar_todo(estado)
+                            redibujar = True
                     elif estado['herramienta_actual'] == "circulo":
                         if not estado['puntos']:
                             estado['puntos'].append((x, y))
@@ -936,18 +1861,18 @@ def main():
                             radio = int(((x - x0) ** 2 + (y - y0) ** 2) ** 0.5)
                             estado = dibujar_circulo(estado, x0, y0, radio)
                             estado['puntos'] = []
-                            estado = redibujar_todo(estado)
+                            redibujar = True
                     elif estado['herramienta_actual'] == "curva":
                         estado['puntos_control'].append((x, y))
                         if len(estado['puntos_control']) == 3:
                             curva = calcular_curva_lagrange(estado['puntos_control'])
-                            estado['curvas_almacenadas'].append((curva, estado['color_actual'], estado['grosor_linea']))
+                            agregar_figura(estado, 'curva', (curva, estado['color_actual'], estado['grosor_linea']))
                             estado['puntos_control'] = []
-                            estado = redibujar_todo(estado)
+                            redibujar = True
                     elif estado['herramienta_actual'] == SELECCIONAR:
                         seleccion = seleccionar_figura(estado, x, y)
                         estado['figura_seleccionada'] = seleccion
-                        estado = redibujar_todo(estado)
+                        redibujar = True
                     elif estado['herramienta_actual'] == "recortar":
                         if not estado['area_recorte_temporal']:
                             estado['area_recorte_temporal'] = [(x, y)]
@@ -976,20 +1901,18 @@ def main():
                             cx2, cy2, radio2 = estado['corazon_datos']['cx2'], estado['corazon_datos']['cy2'], estado['corazon_datos']['radio2']
                             estado = dibujar_circulo(estado, cx1, cy1, radio1)
                             estado = dibujar_circulo(estado, cx2, cy2, radio2)
-                            estado = redibujar_todo(estado)
 
                             # Recorta la mitad inferior (y > min(cy1, cy2))
                             y_recorte = min(cy1, cy2)
                             estado['area_recorte'] = (0, 0, estado['ancho'], y_recorte+5)
                             estado = aplicar_recorte(estado)
-                            estado = redibujar_todo(estado)
 
                             # Dibuja el triángulo inferior (punta del corazón) con Bresenham
                             x_top = (cx1 + cx2) // 2
                             y_bottom = max(cy1 + radio1, cy2 + radio2) + 40
                             estado = dibujar_linea_bresenham(estado, cx1 - radio1, y_recorte, x_top, y_bottom)
                             estado = dibujar_linea_bresenham(estado, cx2 + radio2, y_recorte, x_top, y_bottom)
-                            estado = redibujar_todo(estado)
+                            redibujar = True
 
                             # Limpia el modo corazón
                             estado['modo_corazon'] = None
@@ -1010,7 +1933,7 @@ def main():
                                     pygame.display.quit()
                                     pygame.display.init()
                                     estado = inicializar_pygame(1000, 600)
-                                    estado = redibujar_todo(estado)
+                                    redibujar = True
                                 except Exception as e:
                                     print(f"Error al abrir ventana 3D: {e}")
                             elif herramienta == "ex":
@@ -1019,7 +1942,7 @@ def main():
                                 estado['herramienta_actual'] = herramienta
                                 estado['puntos'].clear()
                                 estado['puntos_control'].clear()
-                                estado = redibujar_todo(estado)
+                                redibujar = True
                             else:
                                 estado['area_recorte'] = None
                             if herramienta != SELECCIONAR:
@@ -1035,7 +1958,7 @@ def main():
 
                     estado['puntos'].clear()
                     estado['puntos_control'].clear()
-                    estado = redibujar_todo(estado)
+                    redibujar = True
             
             elif evento.type == pygame.MOUSEBUTTONUP:
                 if estado['herramienta_actual'] == "recortar" and estado['area_recorte_temporal'] and len(estado['area_recorte_temporal']) == 1:
@@ -1045,7 +1968,8 @@ def main():
                     x1, y1 = estado['area_recorte_temporal'][1]
                     estado['area_recorte'] = (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
                     estado['area_recorte_temporal'] = None
-                    estado = redibujar_todo(estado)
+                    redibujar = True
+                estado = cerrar_trazo(estado)
                 estado['dibujando'] = False
             
             elif evento.type == pygame.MOUSEMOTION and estado['dibujando']:
@@ -1055,51 +1979,93 @@ def main():
                         estado = dibujar_pixel(estado, x, y)
                     elif estado['herramienta_actual'] == "borrador":
                         estado = borrar_en(estado, x, y)
-                    estado = redibujar_todo(estado)
+                    redibujar = True
+                elif estado['area_recorte_temporal']:
+                    redibujar = True
             
             elif evento.type == pygame.KEYDOWN:
                 if evento.key == pygame.K_g and not (pygame.key.get_mods() & pygame.KMOD_SHIFT):
                     estado['mostrar_cuadricula'] = not estado['mostrar_cuadricula']
-                    estado = redibujar_todo(estado)
+                    redibujar = True
                 elif evento.key == pygame.K_t:
                     estado['grosor_linea'] = min(10, estado['grosor_linea'] + 1)
-                    estado = redibujar_todo(estado)
+                    redibujar = True
                 elif evento.key == pygame.K_g and (pygame.key.get_mods() & pygame.KMOD_SHIFT):
                     estado['grosor_linea'] = max(1, estado['grosor_linea'] - 1)
-                    estado = redibujar_todo(estado)
+                    redibujar = True
                 elif evento.key == pygame.K_ESCAPE:
                     estado['area_recorte'] = None
                     estado['area_recorte_temporal'] = None
                     estado['figura_seleccionada'] = None
-                    estado = redibujar_todo(estado)
+                    redibujar = True
                 elif evento.key == pygame.K_c and estado['herramienta_actual'] == "recortar" and estado['area_recorte']:
                     estado = aplicar_recorte(estado)
-                    estado = redibujar_todo(estado)
+                    redibujar = True
                 elif evento.key == pygame.K_f:
                     estado['herramienta_actual'] = SELECCIONAR
-                    estado = redibujar_todo(estado)
+                    redibujar = True
                 elif evento.key == pygame.K_r:
                     if estado['figura_seleccionada']:
                         angulo = 15
                         if pygame.key.get_mods() & pygame.KMOD_SHIFT:
                             angulo = -15
                         estado = rotar_figura(estado, angulo)
-                        estado = redibujar_todo(estado)
+                        redibujar = True
                 elif evento.key == pygame.K_s:
                     if estado['figura_seleccionada']:
                         factor = 1.1
                         if pygame.key.get_mods() & pygame.KMOD_SHIFT:
                             factor = 0.9
                         estado = escalar_figura(estado, factor)
-                        estado = redibujar_todo(estado)
-        
-        if estado['herramienta_actual'] == "recortar" and estado['area_recorte_temporal'] and len(estado['area_recorte_temporal']) == 1:
+                        redibujar = True
+                # Capas: N nueva, L siguiente, V mostrar/ocultar, O opacidad,
+                # [ y ] bajar o subir la capa activa
+                elif evento.key == pygame.K_n:
+                    estado = agregar_capa(estado)
+                    redibujar = True
+                elif evento.key == pygame.K_l:
+                    estado = activar_capa(estado, (estado['capa_activa'] + 1) % len(estado['capas']))
+                    redibujar = True
+                elif evento.key == pygame.K_v:
+                    capa = estado['capas'][estado['capa_activa']]
+                    capa['visible'] = not capa['visible']
+                    redibujar = True
+                elif evento.key == pygame.K_o:
+                    capa = estado['capas'][estado['capa_activa']]
+                    siguiente = (OPACIDADES_CAPA.index(capa['opacidad']) + 1) % len(OPACIDADES_CAPA)
+                    capa['opacidad'] = OPACIDADES_CAPA[siguiente]
+                    redibujar = True
+                elif evento.key in (pygame.K_LEFTBRACKET, pygame.K_RIGHTBRACKET):
+                    estado = mover_capa(estado, 1 if evento.key == pygame.K_RIGHTBRACKET else -1)
+                    redibujar = True
+
+        if redibujar and pendiente_desde is None:
+            pendiente_desde = llegada
+        eventos_sin_mostrar += len(eventos)
+
+        # Un solo redibujado por cuadro, como mucho uno cada PRESUPUESTO_CUADRO_MS
+        if redibujar and ejecutando:
+            restante = ultimo_cuadro + PRESUPUESTO_CUADRO_MS / 1000 - time.perf_counter()
+            if restante > 0:
+                pygame.time.wait(math.ceil(restante * 1000))
+                continue
             estado = redibujar_todo(estado)
-        
-        pygame.time.wait(10)
-    
+            ultimo_cuadro = time.perf_counter()
+            latencias.append(ultimo_cuadro - pendiente_desde)
+            eventos_por_cuadro.append(eventos_sin_mostrar)
+            redibujar = False
+            pendiente_desde = None
+            eventos_sin_mostrar = 0
+
     pygame.quit()
+    if latencias:
+        latencias.sort()
+        print(f"Latencia entrada-pantalla: media {1000 * sum(latencias) / len(latencias):.1f} ms, "
+              f"p95 {1000 * latencias[math.ceil(0.95 * len(latencias)) - 1]:.1f} ms, "
+              f"máxima {1000 * latencias[-1]:.1f} ms en {len(latencias)} cuadros "
+              f"({sum(eventos_por_cuadro) / len(eventos_por_cuadro):.1f} eventos por cuadro)")
 
 
 #Se ejecuta la funcion principal
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
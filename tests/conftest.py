@@ -0,0 +1,11 @@
+# Los módulos del proyecto están en la raíz del repositorio. Las pruebas
+# corren sin pantalla: SDL sin ventana y OpenGL por EGL, que se eligen antes
+# de que algún módulo importe pygame u OpenGL
+import os
+import sys
+
+os.environ.setdefault("SDL_VIDEODRIVER", "offscreen")
+os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,44 @@
+# Pruebas sin pantalla del rasterizado de lineas.py
+import numpy as np
+import pytest
+
+import lineas
+
+
+def lineas_al_azar(cantidad, minimo, maximo, semilla):
+    rng = np.random.default_rng(semilla)
+    xs = rng.integers(minimo, maximo[0], (cantidad, 2))
+    ys = rng.integers(minimo, maximo[1], (cantidad, 2))
+    return [((int(xs[k, 0]), int(ys[k, 0])), (int(xs[k, 1]), int(ys[k, 1]))) for k in range(cantidad)]
+
+
+def test_rasterizar_lineas_igual_a_bresenham():
+    casos = lineas_al_azar(300, -50, (lineas.ANCHO + 50, lineas.ALTO + 50), 0)
+    casos += [((5, 5), (5, 5)), ((0, 0), (10, 0)), ((0, 0), (0, -10)), ((3, 7), (-4, -9))]
+    esperado = [p for (inicio, fin) in casos for p in lineas.bresenham(*inicio, *fin)]
+    np.testing.assert_array_equal(lineas.rasterizar_lineas(casos), np.array(esperado))
+
+
+def test_rasterizar_lineas_vacio():
+    assert lineas.rasterizar_lineas([]).shape == (0, 2)
+
+
+@pytest.mark.parametrize("tamanho", [1, 2, 3, 4, 5])
+def test_framebuffer_lineas_dentro(tamanho):
+    # Líneas lejos del borde: cada píxel de Bresenham pinta un cuadrado de
+    # tamanho x tamanho desde x - tamanho//2, como GL_POINTS
+    margen = 5
+    casos = lineas_al_azar(50, margen, (lineas.ANCHO - margen, lineas.ALTO - margen), tamanho)
+    color = (0.2, 0.4, 1.0)
+    fondo = (0.0, 0.0, 0.0)
+
+    esperado = np.zeros((lineas.ALTO, lineas.ANCHO, 3), dtype=np.uint8)
+    for inicio, fin in casos:
+        for x, y in lineas.bresenham(*inicio, *fin):
+            x0 = x - tamanho // 2
+            y0 = y - tamanho // 2
+            esperado[y0:y0 + tamanho, x0:x0 + tamanho] = (51, 102, 255)
+    esperado = esperado[::-1]  # La fila 0 es la parte superior de la ventana
+
+    obtenido = lineas.rasterizar_framebuffer(casos, color, tamanho, fondo)
+    np.testing.assert_array_equal(obtenido, esperado)
@@ -0,0 +1,114 @@
+# El lienzo persistente de paint.py, actualizado por partes, tiene que quedar
+# igual que si se dibujaran todas las figuras de nuevo
+import random
+
+import numpy as np
+import pygame
+import pytest
+from OpenGL.GL import *
+
+import paint
+
+ANCHO, ALTO = 640, 480
+
+
+@pytest.fixture
+def estado():
+    try:
+        estado = paint.inicializar_pygame(ANCHO, ALTO)
+    except pygame.error as e:
+        pytest.skip(f"sin contexto OpenGL: {e}")
+    if estado['lienzo'] is None:
+        pytest.skip("el controlador no soporta framebuffer objects")
+    yield estado
+    pygame.quit()
+
+
+def leer_rgb():
+    datos = glReadPixels(0, 0, ANCHO, ALTO, GL_RGB, GL_UNSIGNED_BYTE)
+    return np.frombuffer(datos, np.uint8).reshape(ALTO, ANCHO, 3).copy()
+
+
+# Lleva el lienzo al día por el camino normal (incremental o por zonas) y lo lee
+def leer_lienzo(estado):
+    paint.actualizar_lienzo(estado)
+    glBindFramebuffer(GL_FRAMEBUFFER, estado['lienzo']['fbo'])
+    imagen = leer_rgb()
+    glBindFramebuffer(GL_FRAMEBUFFER, 0)
+    return imagen
+
+
+# Todas las figuras dibujadas de cero sobre el fondo transparente
+def leer_completo(estado):
+    glClearColor(0, 0, 0, 0)
+    glClear(GL_COLOR_BUFFER_BIT)
+    paint.dibujar_almacenados(estado)
+    return leer_rgb()
+
+
+def comprobar(estado):
+    diferentes = (leer_lienzo(estado) != leer_completo(estado)).any(axis=2).sum()
+    assert diferentes == 0
+
+
+def trazo(estado, puntos, color):
+    estado['color_actual'] = color
+    for x, y in puntos:
+        paint.dibujar_pixel(estado, x, y)
+    paint.cerrar_trazo(estado)
+
+
+def test_trazo_nuevo_sobre_linea(estado):
+    estado['color_actual'] = (0, 0, 0)
+    paint.dibujar_linea_bresenham(estado, 100, 300, 500, 300)
+    leer_lienzo(estado)
+    trazo(estado, [(300, y) for y in range(250, 350, 5)], (1, 0, 0))
+    comprobar(estado)
+
+    # Borrar junto al cruce repinta solo una zona: fuera de ella el lienzo
+    # tiene que seguir igual que un repintado completo
+    estado['tamanho_borrador'] = 3
+    paint.borrar_en(estado, 300, 290)
+    comprobar(estado)
+
+
+def test_figura_nueva_debajo_de_otra(estado):
+    paint.agregar_figura(estado, 'rectangulo', (200, 200, 400, 400, (0, 1, 0), 3))
+    leer_lienzo(estado)
+    curva = paint.calcular_curva_lagrange([(150, 300), (300, 100), (450, 300)])
+    paint.agregar_figura(estado, 'curva', (curva, (1, 0, 1), 3))
+    comprobar(estado)
+
+
+def test_estilos_alternados_conservan_el_orden(estado):
+    for color, y in (((1, 0, 0), 100), ((0, 0, 1), 105), ((1, 0, 0), 110)):
+        trazo(estado, [(x, y + (x - 100) // 10) for x in range(100, 200, 5)], color)
+        leer_lienzo(estado)
+    for color, cx in (((1, 0, 0), 300), ((0, 0, 1), 320), ((1, 0, 0), 340)):
+        estado['color_actual'] = color
+        paint.dibujar_circulo(estado, cx, 300, 40)
+        leer_lienzo(estado)
+    comprobar(estado)
+
+
+def test_operaciones_al_azar(estado):
+    azar = random.Random(0)
+    colores = [(1, 0, 0), (0, 0, 1), (0, 0.5, 0), (0, 0, 0)]
+    for paso in range(60):
+        estado['color_actual'] = azar.choice(colores)
+        estado['grosor_linea'] = azar.randint(1, 5)
+        x, y = azar.randint(0, ANCHO), azar.randint(41, ALTO)
+        accion = azar.randrange(5)
+        if accion == 0:
+            trazo(estado, [(x + 4 * k, y + azar.randint(-3, 3)) for k in range(20)], estado['color_actual'])
+        elif accion == 1:
+            paint.dibujar_linea_bresenham(estado, x, y, azar.randint(0, ANCHO), azar.randint(41, ALTO))
+        elif accion == 2:
+            paint.dibujar_circulo(estado, x, y, azar.randint(5, 60))
+        elif accion == 3:
+            paint.agregar_figura(estado, 'rectangulo', (x, y, x + 80, y + 50, estado['color_actual'], estado['grosor_linea']))
+        else:
+            paint.borrar_en(estado, x, y)
+        if paso % 3 == 0:
+            leer_lienzo(estado)
+    comprobar(estado)